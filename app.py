@@ -1,56 +1,32 @@
+import hashlib
+import io
+import os
+import tempfile
+import time
+import uuid
+
 import streamlit as st
-import tensorflow as tf
 import numpy as np
-from PIL import Image
-import json
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+import pandas as pd
+
+from insectifica import config, metrics, traps
+from insectifica.cache import PredictionCache
+from insectifica.cards import CARD_CSS, SpeciesCards
+from insectifica.history import HistoryStore, thumbnail_bytes
+from insectifica.inference import InterpreterPool, start_warmup
+from insectifica.rollups import Rollups
+from insectifica.postprocess import NON_INSECT_INDEX, calibrate, is_unknown, top_k
+from insectifica.quality import FEEDBACK, check as check_photo
+from insectifica.registry import load_registry
+from insectifica.search import SpeciesIndex
+from insectifica.similarity import ReferenceIndex
+from insectifica.preprocessing import PREVIEW_SIZE, open_image, to_model_input
+from insectifica.species import class_names, load_knowledge_base
+from insectifica.tta import aggregate_views, build_views, fuse_specimen
 
 # --------------------------------------------------
 # Page Configuration
 # --------------------------------------------------
-# Hide hamburger menu, footer, header, and toolbar completely
-# Hide Streamlit's top-right menu (hamburger ☰), Manage app, Deploy button, toolbar, footer, etc.
-st.markdown("""
-<style>
-[data-testid="stToolbar"] {display: none !important;}
-</style>
-""", unsafe_allow_html=True)
-
-hide_streamlit_elements = """
-    <style>
-    /* Hide the main hamburger menu */
-    #MainMenu {visibility: hidden !important;}
-    
-    /* Hide the toolbar (new in recent versions) */
-    .stToolbar {display: none !important;}
-    
-    /* Hide Deploy button */
-    .stDeployButton {display: none !important;}
-    
-    /* Hide header bar */
-    header {visibility: hidden !important;}
-    
-    /* Hide footer ("Made with Streamlit") */
-    footer {visibility: hidden !important;}
-    
-    /* Extra safety for any new elements */
-    [data-testid="stToolbar"] {display: none !important;}
-    [data-testid="manage-app-button"] {display: none !important;}
-    </style>
-"""
-st.markdown(hide_streamlit_elements, unsafe_allow_html=True)
-
-# Optional: make the page look even cleaner
-
-
-st.markdown("""
-<style>
-#MainMenu {visibility: hidden;}
-footer {visibility: hidden;}
-header {visibility: hidden;}
-</style>
-""", unsafe_allow_html=True)
-
 st.set_page_config(
     page_title="INSECTIFICA",
     page_icon="🐞",
@@ -61,8 +37,20 @@ st.set_page_config(
 # --------------------------------------------------
 # Custom CSS
 # --------------------------------------------------
-st.markdown("""
-<style>
+# Kept in a single <style> element. Streamlit removes whatever a rerun doesn't
+# emit, so it is still sent every run, but once and always identical.
+APP_CSS = """
+/* --------------------------------------------------
+   HIDE STREAMLIT CHROME
+   (hamburger menu, toolbar, Deploy / Manage app buttons, header, footer)
+-------------------------------------------------- */
+#MainMenu {visibility: hidden !important;}
+.stToolbar {display: none !important;}
+.stDeployButton {display: none !important;}
+header {visibility: hidden !important;}
+footer {visibility: hidden !important;}
+[data-testid="stToolbar"] {display: none !important;}
+[data-testid="manage-app-button"] {display: none !important;}
 
 /* --------------------------------------------------
    GLOBAL APP THEME
@@ -171,53 +159,82 @@ img {
     }
 }
 
-</style>
-""", unsafe_allow_html=True)
+"""
+st.markdown("<style>" + APP_CSS + CARD_CSS + "</style>", unsafe_allow_html=True)
 
 
 # --------------------------------------------------
 # Load Data & Model
 # --------------------------------------------------
-with open("pest.json", "r") as f:
-    insect_data = json.load(f)
-
-class_names = [
-    'Acanthophilus helianthi rossi', 'Achaea janata', 'Acherontia styx', 'Adisura atkinsoni',
-    'Aedes aegypti', 'Aedes albopictus', 'Agrotis ipsilon', 'Alcidodes affaber',
-    'Aleurodicus dispersus', 'Amsacta albistriga', 'Anarsia ephippias', 'Anarsia epoitas',
-    'Anisolabis stallii', 'Antestia cruciata', 'Aphis craccivora', 'Apis mellifera',
-    'Apriona cinerea', 'Araecerus fasciculatus', 'Atractomorpha crenulata', 'Autographa nigrisigna',
-    'Bagrada hilaris', 'Basilepta fulvicorne', 'Batocera rufomaculata', 'Calathus erratus',
-    'Camponotus consobrinus', 'Chilasa clytia', 'Chilo sacchariphagus indicus',
-    'Conogethes punctiferalis', 'Danaus plexippus', 'Dendurus coarctatus',
-    'Deudorix (Virachola) isocrates', 'Elasmopalpus jasminophagus', 'Euwallacea fornicatus',
-    'Ferrisia virgata', 'Formosina flavipes', 'Gangara thyrsis', 'Holotrichia serrata',
-    'Hydrellia philippina', 'Hypolixus truncatulus', 'Leucopholis burmeisteri',
-    'Libellula depressa', 'Lucilia sericata', 'Melanagromyza obtusa', 'Mylabris phalerata',
-    'Oryctes rhinoceros', 'Paracoccus marginatus', 'Paradisynus rostratus', 'Parallelia algira',
-    'Parasa lepida', 'Pectinophora gossypiella', 'Pelopidas mathias', 'Pempherulus affinis',
-    'Pentalonia nigronervosa', 'peregrius maidis', 'Pericallia ricini', 'Perigea capensis',
-    'Petrobia latens', 'Phenacoccus solenopsis', 'Phoetaliotes nebrascensis',
-    'Phthorimaea operculella', 'Phyllocnistis citrella', 'Pieris brassicae', 'Pulchriphyllium',
-    'Rapala varuna', 'Rastrococcus iceryoides', 'Retithrips siriacus', 'Retithrips syriacus',
-    'Rhipiphorothrips cruentatus', 'Rhopalosiphum maidis', 'Rhopalosiphum padi',
-    'Rhynchophorus ferrugineus', 'Riptortus pedestris', 'Sahyadrassus malabaricus',
-    'Saissetia coffeae', 'Streptanus aemulans', 'sustama gremius', 'Sylepta derogata',
-    'Sympetrum signiferum', 'Sympetrum vulgatum', 'Tanymecus indicus Faust',
-    'Tetraneura nigriabdominalis', 'Tetrachynus cinnarinus', 'Tetranychus piercei',
-    'Thalassodes quadraria', 'Thosea andamanica', 'Thrips nigripilosus', 'Thrips orientalis',
-    'Thrips tabaci', 'Thysanoplusia orichalcea', 'Toxoptera odinae', 'Trialeurodes rara',
-    'Trialeurodes ricini', 'Trichoplusia ni', 'Tuta absoluta', 'Udaspes folus',
-    'Urentius hystricellus', 'uroleucon carthami', 'Vespula germanica', 'Xeroma mura',
-    'xylosadrus compactus', 'Xylotrchus quadripes', 'Zeuzera coffe', 'non insects',
-    'Papilio polytes', 'Periplaneta americana'
-]
+# Parsed and validated against class_names once per process
+knowledge_base = load_knowledge_base()
+
+@st.cache_resource
+def load_search_index():
+    return SpeciesIndex(knowledge_base)
+
+
+@st.cache_resource
+def load_models():
+    # One registry per process, shared by every session: each served model version has
+    # its own interpreter pool and a scheduler that lets uploads share forward passes.
+    # New versions are warmed and swapped in by a background thread.
+    models = load_registry(pool_size=config.POOL_SIZE)
+    metrics.register(metrics.Gauge(
+        "insectifica_scheduler_queue_depth", "Images waiting for a forward pass.",
+        fn=models.queue_depth,
+    ))
+    return models
+
+@st.cache_resource
+def start_metrics_endpoint():
+    return metrics.start_http_server(config.METRICS_PORT)
+
+@st.cache_resource
+def warm_up_model():
+    # Runs once per process; TensorFlow/tflite-runtime is imported on this thread.
+    return start_warmup(load_models().active.pool)
+
+@st.cache_resource
+def load_prediction_cache():
+    # Shared by every session; the SQLite tier is shared across processes too.
+    return PredictionCache(config.CACHE_SIZE, db_path=config.CACHE_DB,
+                           max_rows=config.CACHE_DB_MAX_ROWS, max_age_days=config.CACHE_DB_MAX_AGE_DAYS)
 
 @st.cache_resource
-def load_model():
-    return tf.keras.models.load_model('mobilenetv2_insect.tflite')
+def load_species_cards(version):
+    # Keyed by the knowledge-base version, so edited species data gets new cards.
+    return SpeciesCards(knowledge_base)
 
-model = load_model()
+@st.cache_resource
+def load_reference_search():
+    # (embedding interpreters, IVF index) once both have been built, else None.
+    index = ReferenceIndex.load()
+    if index is None or not os.path.exists(config.EMBEDDING_MODEL_PATH):
+        return None
+    return InterpreterPool(config.EMBEDDING_MODEL_PATH, size=1), index
+
+@st.cache_resource
+def load_history():
+    # One background writer per process; None when INSECTIFICA_HISTORY_DB is empty.
+    return HistoryStore(config.HISTORY_DB) if config.HISTORY_DB else None
+
+@st.cache_resource
+def load_rollups():
+    # Registered on the writer before anything is recorded, so no batch is missed.
+    history = load_history()
+    return Rollups(history, knowledge_base) if history is not None else None
+
+species_cards = load_species_cards(knowledge_base.version)
+models = load_models()
+prediction_cache = load_prediction_cache()
+history = load_history()
+rollups = load_rollups()
+reference_search = load_reference_search()
+if config.METRICS and config.METRICS_PORT:
+    start_metrics_endpoint()
+if config.WARMUP:
+    warm_up_model()
 
 # --------------------------------------------------
 # Helper Functions
@@ -232,6 +249,88 @@ def ui_card(title, content):
         """, unsafe_allow_html=True
     )
 
+def species_details(predicted_class):
+    # Detailed Info, pre-rendered as one HTML card per species
+    card = species_cards.get(predicted_class)
+    if card is not None:
+        st.markdown(card, unsafe_allow_html=True)
+    else:
+        st.warning("🔍 Detailed information for this species is not yet available in our database.")
+
+def predict_images(images, served, multi_view=False):
+    # Uncalibrated class probabilities from model version ``served``, one row per image
+    if multi_view:
+        # Every view of every image goes through one forward pass
+        return aggregate_views(models.predict(build_views(images), served, scheduled=False))
+    height, width = config.IMAGE_SIZE[1], config.IMAGE_SIZE[0]
+    batch = np.empty((len(images), height, width, 3), dtype=np.float32)
+    for row, image in enumerate(images):
+        to_model_input(image, out=batch[row])
+    return models.predict(batch, served)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def photo_issue(data, _image):
+    # Keyed on the upload's bytes, so a photo is checked (and counted) once
+    return check_photo(_image)
+
+def photo_feedback(issue, name=None):
+    icon, tip, message = FEEDBACK[issue]
+    prefix = f"**{name}:** " if name else ""
+    st.warning(f"{icon} {prefix}**{tip}** — {message}")
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def count_trap(data, version, temperature, _served):
+    # Detections and annotated overlay of one sticky-trap photo, decoded at full detail
+    image = traps.load_trap(io.BytesIO(data))
+    detections = traps.detect(image, lambda batch: models.predict(batch, _served, scheduled=False), temperature)
+    return detections, traps.annotate(image, detections)
+
+def trap_results(uploaded_files, served):
+    st.markdown("---")
+    st.markdown("<h3 style='text-align: center; color: #2e7d32;'>Trap Counts</h3>", unsafe_allow_html=True)
+    for f in uploaded_files:
+        with st.spinner("🤖 AI is finding and identifying every insect on the trap... Please wait a moment"):
+            detections, overlay = count_trap(f.getvalue(), served.version, served.temperature, served)
+        counts = traps.species_counts(detections)
+        total = sum(count for _, count in counts)
+        with st.expander(f"{f.name} — {total} insects", expanded=len(uploaded_files) == 1):
+            st.image(overlay, use_container_width=True, caption="Detected insects")
+            if not counts:
+                st.info("No insects found on this trap.")
+                continue
+            index_of = {d["species"]: d["class_index"] for d in detections if d["species"]}
+            rows = [{
+                "Species": species,
+                "Common Name": knowledge_base[index_of[species]].get("Common Name", "") if species in index_of else "",
+                "Count": count,
+            } for species, count in counts]
+            st.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+            st.write(f"**Total:** {total} insects")
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def reference_neighbours(data):
+    # Nearest reference specimens of one upload, as [(row, similarity), ...]
+    embedder, index = reference_search
+    image = open_image(io.BytesIO(data), PREVIEW_SIZE)
+    embedding = embedder.predict(to_model_input(image)[None])
+    rows, scores = index.search(embedding, config.REFERENCE_NEIGHBOURS)
+    return list(zip(rows.tolist(), scores.tolist()))
+
+def reference_gallery(data):
+    index = reference_search[1]
+    st.markdown("#### 🖼️ Closest Reference Specimens")
+    cols = st.columns(config.REFERENCE_NEIGHBOURS)
+    for col, (row, similarity) in zip(cols, reference_neighbours(data)):
+        label = int(index.labels[row])
+        details = knowledge_base[label]
+        with col:
+            path = index.path(row)
+            if os.path.exists(path):
+                st.image(path, use_container_width=True)
+            st.caption(f"**{class_names[label]}** ({details.get('Common Name', '')}) · {similarity:.0%} similar")
+            st.caption(f"{details.get('Order', 'N/A')} › {details.get('Family', 'N/A')} · "
+                       f"🌿 {details.get('Host Crops', 'N/A')}")
+
 def how_it_works_section():
     ui_card(
         "🧠 How Insectifica Works",
@@ -282,140 +381,142 @@ def intro_page():
               st.rerun()
     st.divider()
 
-    col_a, col_b, col_c, col_d = st.columns(4)
+    col_a, col_b, col_c, col_d, col_e = st.columns(5)
     with col_a:
         if st.button("ℹ️ About App"):
             with st.spinner("Wait Loading..."):
               st.session_state.page = "about_app"
               st.rerun()
+    with col_b:
+        if st.button("🔎 Search Pests"):
+            with st.spinner("Wait Loading..."):
+              st.session_state.page = "search"
+              st.rerun()
+    with col_c:
+        if st.button("🕘 History"):
+            with st.spinner("Wait Loading..."):
+              st.session_state.page = "history"
+              st.rerun()
     with col_d:
         if st.button("👨‍🔬 Developers"):
             with st.spinner("Wait Loading..."):
                  st.session_state.page = "developers"
                  st.rerun()
+    with col_e:
+        if st.button("📈 Outbreaks"):
+            with st.spinner("Wait Loading..."):
+              st.session_state.page = "dashboard"
+              st.rerun()
 
-def about_app_page():
-     st.title("ℹ️ About INSECTIFICA")
+# Static page text, one markdown element per page
+ABOUT_TEXT = """
+**Insectifica** is an AI-powered mobile application designed to help users instantly identify
+insects, pests, and other arthropods from photographs. It leverages advanced image recognition
+techniques and a comprehensive entomological database to make insect identification accessible
+to professionals, scientists, gardeners, farmers, and nature enthusiasts alike.
 
-     st.markdown("""
-        **Insectifica** is an AI-powered mobile application designed to help users instantly identify
-        insects, pests, and other arthropods from photographs. It leverages advanced image recognition
-        techniques and a comprehensive entomological database to make insect identification accessible
-        to professionals, scientists, gardeners, farmers, and nature enthusiasts alike.
-
-        Insectifica is an **educational and research-support application** developed by the  
-        **Department of Biotechnology, St. Joseph’s College (Autonomous), Tiruchirappalli**.
-
-        Developed with a commitment to educational and research excellence, Insectifica reflects
-        St. Joseph’s College and the Department of Biotechnology’s ongoing mission to promote
-        scientific awareness, support research, and create innovative tools that empower learners
-        and professionals in the field of Biotechnology.
-        """
-    )
+Insectifica is an **educational and research-support application** developed by the  
+**Department of Biotechnology, St. Joseph’s College (Autonomous), Tiruchirappalli**.
 
-     st.divider()
+Developed with a commitment to educational and research excellence, Insectifica reflects
+St. Joseph’s College and the Department of Biotechnology’s ongoing mission to promote
+scientific awareness, support research, and create innovative tools that empower learners
+and professionals in the field of Biotechnology.
 
-     st.header("🎯 Core Purpose")
-     st.markdown(
-        """
-        Insectifica’s primary goal is to provide **fast and accurate identification**
-        of insects and pests using a simple photograph captured through a smartphone camera.
+---
 
-        Whether encountering a tiny beetle in a home garden, a mysterious insect indoors,
-        or a potentially harmful pest in agricultural fields, Insectifica delivers
-        **reliable identification results** along with **educational insights**—all with
-        minimal effort.
-        """
-    )
+## 🎯 Core Purpose
 
-     st.divider()
-     if st.button("➡️ Features & Use Cases"):
-         with st.spinner("Wait Loading..."):
-          st.session_state.page = "features"
-          st.rerun()
-     if st.button("⬅️ Back"):
-         with st.spinner("Wait Loading..."):
-          st.session_state.page = "intro"
-          st.rerun()
+Insectifica’s primary goal is to provide **fast and accurate identification**
+of insects and pests using a simple photograph captured through a smartphone camera.
 
-def features_page():
-     st.title("✨ Features & Use Cases")
- 
-     st.header("🔑 Key Features of Insectifica")
-     st.markdown(
-        """
-        • **Instant Identification:**  
-        Identify insects and arthropods instantly from photographs using advanced
-        machine learning—ideal for both casual users and experts.
+Whether encountering a tiny beetle in a home garden, a mysterious insect indoors,
+or a potentially harmful pest in agricultural fields, Insectifica delivers
+**reliable identification results** along with **educational insights**—all with
+minimal effort.
+"""
 
-        • **Comprehensive Species Database:**  
-        Access detailed profiles of hundreds of insect and pest species including
-        butterflies, ants, beetles, moths, spiders, and major agricultural pests.
+FEATURES_TEXT = """
+## 🔑 Key Features of Insectifica
 
-        • **Pest vs. Beneficial Indicator:**  
-        Clearly distinguish whether a species is harmful (pest), neutral, or beneficial
-        (such as pollinators and natural predators).
+• **Instant Identification:**  
+Identify insects and arthropods instantly from photographs using advanced
+machine learning—ideal for both casual users and experts.
 
-        • **Habitat & Behaviour Insights:**  
-        Each identification includes habitat preferences, life cycle details, feeding
-        habits, and ecological roles.
+• **Comprehensive Species Database:**  
+Access detailed profiles of hundreds of insect and pest species including
+butterflies, ants, beetles, moths, spiders, and major agricultural pests.
 
-        • **Identification History:**  
-        Save and review past identifications—useful for students, educators, researchers,
-        and biodiversity documentation.
+• **Pest vs. Beneficial Indicator:**  
+Clearly distinguish whether a species is harmful (pest), neutral, or beneficial
+(such as pollinators and natural predators).
 
-        • **Community & Sharing:**  
-        Share discoveries with peers or within a community to encourage collaborative
-        learning and nature awareness.
-        """
-    )
+• **Habitat & Behaviour Insights:**  
+Each identification includes habitat preferences, life cycle details, feeding
+habits, and ecological roles.
 
-     st.divider()
+• **Identification History:**  
+Save and review past identifications—useful for students, educators, researchers,
+and biodiversity documentation.
 
-     st.header("👥 Use Cases")
-     st.markdown(
-        """
-        • **Gardeners & Homeowners:**  
-        Identify pests affecting plants and learn natural pest management tips.
+• **Community & Sharing:**  
+Share discoveries with peers or within a community to encourage collaborative
+learning and nature awareness.
 
-        • **Students & Educators:**  
-        Use real identifications in biology classes and field projects for hands-on learning.
+---
 
-        • **Farmers & Agriculturists:**  
-        Spot agricultural pests early and decide integrated pest management steps.
+## 👥 Use Cases
 
-        • **Nature Enthusiasts:**  
-         Explore biodiversity around you and build personal insect sighting collections.
-        """
-    )
+• **Gardeners & Homeowners:**  
+Identify pests affecting plants and learn natural pest management tips.
 
-     st.divider()
+• **Students & Educators:**  
+Use real identifications in biology classes and field projects for hands-on learning.
 
-     st.header("🌍 Why Insectifica Is Useful")
-     st.markdown(
-        """
-        Insectifica bridges the gap between expert entomological identification and everyday curiosity. By combining AI technology with scientific databases, it transforms insect and pest encounters into educational moments, helps reduce fear or misinformation about bugs and enables data collection for broader ecological insights..
-        """
-    )
+• **Farmers & Agriculturists:**  
+Spot agricultural pests early and decide integrated pest management steps.
 
-     st.divider()
+• **Nature Enthusiasts:**  
+ Explore biodiversity around you and build personal insect sighting collections.
 
-     st.header("📸 Notes & Best Practices")
-     st.markdown(
-        """
-        • Capture clear, well-focused images under good lighting conditions.  
-        • Take photographs from multiple angles whenever possible.  
-        • Ensure key anatomical features such as wings, legs, antennae, and body patterns
-          are clearly visible to improve identification accuracy.
-        """
-    )
+---
+
+## 🌍 Why Insectifica Is Useful
+
+Insectifica bridges the gap between expert entomological identification and everyday curiosity. By combining AI technology with scientific databases, it transforms insect and pest encounters into educational moments, helps reduce fear or misinformation about bugs and enables data collection for broader ecological insights..
+
+---
 
+## 📸 Notes & Best Practices
+
+• Capture clear, well-focused images under good lighting conditions.  
+• Take photographs from multiple angles whenever possible.  
+• Ensure key anatomical features such as wings, legs, antennae, and body patterns
+  are clearly visible to improve identification accuracy.
+
+---
+
+## 📸 Best Practices
+
+• Accuracy improves with clear, focused photos taken from multiple angles — close enough to see key insect traits.
+"""
+
+def about_app_page():
+     st.title("ℹ️ About INSECTIFICA")
+     st.markdown(ABOUT_TEXT)
      st.divider()
+     if st.button("➡️ Features & Use Cases"):
+         with st.spinner("Wait Loading..."):
+          st.session_state.page = "features"
+          st.rerun()
+     if st.button("⬅️ Back"):
+         with st.spinner("Wait Loading..."):
+          st.session_state.page = "intro"
+          st.rerun()
 
-     st.header("📸 Best Practices")
-     st.markdown("""
-      • Accuracy improves with clear, focused photos taken from multiple angles — close enough to see key insect traits.
-      """)
+def features_page():
+     st.title("✨ Features & Use Cases")
+     st.markdown(FEATURES_TEXT)
      if st.button("👨‍🔬 Developers"):
           with st.spinner("Wait Loading..."):
             st.session_state.page = "developers"
@@ -464,6 +565,177 @@ def developers_page():
               st.rerun()
 
 
+def search_page():
+    st.title("🔎 Search Pests")
+    st.markdown("Find pests by the crop they attack, their taxonomy, or the damage you see in the field.")
+
+    search_index = load_search_index()
+    crop = st.text_input("🌿 Host crop", placeholder="e.g. Cotton, Castor, Rice")
+    taxon = st.text_input("🧬 Name, Order or Family", placeholder="e.g. Lepidoptera, Aphididae, whitefly")
+    symptoms = st.text_input("🐛 Damage symptoms", placeholder="e.g. leaf curling, holes in fruit")
+
+    if crop or taxon or symptoms:
+        matches = search_index.search(crop=crop, taxon=taxon, text=symptoms, limit=25)
+        st.markdown("---")
+        if not matches:
+            st.warning("🔍 No species match this search. Try fewer or shorter words.")
+        for idx in matches:
+            details = knowledge_base[idx]
+            with st.expander(f"{details.get('Common Name', class_names[idx])} — *{class_names[idx]}*"):
+                species_details(class_names[idx])
+    else:
+        st.info("👆 Type a crop, a taxon or a symptom to start searching.")
+
+    st.markdown("---")
+    if st.button("⬅️ Back to Home", use_container_width=True, key="back_search"):
+         with st.spinner("Wait Loading..."):
+              st.session_state.page = "intro"
+              st.rerun()
+
+def export_history(fmt):
+    # Runs when the button is clicked; rows are streamed into a temporary file
+    # and only the finished file is read back for the download.
+    with tempfile.TemporaryFile() as f:
+        if fmt == "xlsx":
+            history.export_xlsx(f)
+        else:
+            text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            history.export_csv(text)
+            text.detach()
+        f.seek(0)
+        return f.read()
+
+def history_page():
+    st.title("🕘 Identification History")
+
+    if history is None:
+        st.info("History is turned off on this server.")
+    else:
+        species_filter = st.selectbox("🐞 Species", ["All species"] + class_names)
+        species_filter = None if species_filter == "All species" else species_filter
+        if "history_cursors" not in st.session_state or st.session_state.history_filter != species_filter:
+            # Cursor stack of page boundaries; the last entry is the current page
+            st.session_state.history_filter = species_filter
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+
+        rows = history.page(before_id=cursors[-1], limit=20, species=species_filter)
+        st.caption(f"{history.count(species_filter):,} identifications recorded")
+        if not rows:
+            st.info("Nothing recorded yet. Identified insects will appear here.")
+        for row in rows:
+            col_img, col_text = st.columns([1, 4])
+            with col_img:
+                if row["thumbnail"]:
+                    st.image(row["thumbnail"], width=96)
+            with col_text:
+                label = "❓ Not identified" if row["unknown"] else f"**{row['species']}**"
+                taken = time.strftime("%d %b %Y, %H:%M", time.localtime(row["created"]))
+                st.write(f"{label} · {row['confidence']:.1%}")
+                st.caption(f"{taken} · model {row['model_version']}")
+
+        col_newer, col_older = st.columns(2)
+        with col_newer:
+            if len(cursors) > 1 and st.button("⬅️ Newer", use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with col_older:
+            if len(rows) == 20 and st.button("Older ➡️", use_container_width=True):
+                cursors.append(rows[-1]["id"])
+                st.rerun()
+
+        st.markdown("---")
+        st.markdown("#### 📥 Export")
+        col_csv, col_xlsx = st.columns(2)
+        with col_csv:
+            st.download_button("⬇️ CSV", data=lambda: export_history("csv"),
+                               file_name="insectifica_history.csv", mime="text/csv",
+                               use_container_width=True)
+        with col_xlsx:
+            st.download_button("⬇️ Excel", data=lambda: export_history("xlsx"),
+                               file_name="insectifica_history.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                               use_container_width=True)
+
+    st.markdown("---")
+    if st.button("⬅️ Back to Home", use_container_width=True, key="back_history"):
+         with st.spinner("Wait Loading..."):
+              st.session_state.page = "intro"
+              st.rerun()
+
+def dashboard_page():
+    st.title("📈 Outbreak Dashboard")
+    st.markdown("Which pests are being identified most, and which are rising, across every user of this app.")
+
+    if rollups is None:
+        st.info("History is turned off on this server, so there is nothing to summarise.")
+    else:
+        days = st.radio("Period", [7, 30, 90], index=1, horizontal=True,
+                        format_func=lambda d: f"Last {d} days")
+        # Read from the daily rollup tables; cost depends on days × species, not on history size
+        daily = pd.DataFrame(rollups.species_by_day(days), columns=["day", "species", "count", "unknown"])
+        if daily.empty:
+            st.info("No identifications in this period yet.")
+        else:
+            insects = daily[daily.species != class_names[NON_INSECT_INDEX]]
+            col_total, col_unknown, col_species = st.columns(3)
+            col_total.metric("Identifications", f"{int(daily['count'].sum()):,}")
+            col_unknown.metric("Not identified", f"{daily['unknown'].sum() / daily['count'].sum():.0%}")
+            col_species.metric("Species seen", insects.species.nunique())
+
+            # Identified insects per day, with days that had none filled in as zero
+            confident = insects.assign(count=insects["count"] - insects["unknown"])
+            calendar = pd.date_range(end=pd.Timestamp.now().normalize(), periods=days).strftime("%Y-%m-%d")
+            counts = (confident.pivot_table(index="day", columns="species", values="count",
+                                            aggfunc="sum", fill_value=0)
+                      .reindex(calendar, fill_value=0))
+
+            # Spikes: the last three days against the daily average before them
+            recent = counts.tail(3).mean()
+            baseline = counts.iloc[:-3].mean()
+            spikes = pd.DataFrame({
+                "Last 3 days": counts.tail(3).sum(),
+                "Daily avg. before": baseline.round(2),
+                "Change": (recent / baseline.where(baseline > 0)).round(1),
+                "excess": recent - baseline,
+            })
+            spikes = spikes[spikes.excess > 0].sort_values("excess", ascending=False).head(10)
+
+            st.markdown("### 🚨 Rising Pests")
+            if spikes.empty:
+                st.success("No pest is rising above its usual level.")
+            else:
+                st.dataframe(spikes.drop(columns="excess").rename_axis("Species"),
+                             use_container_width=True,
+                             column_config={"Change": st.column_config.NumberColumn(format="×%.1f")})
+
+            st.markdown("### 📅 Daily Identifications")
+            top = counts.sum().nlargest(5).index
+            st.line_chart(counts[top])
+
+            col_order, col_family = st.columns(2)
+            for col, rank in ((col_order, "Order"), (col_family, "Family")):
+                with col:
+                    st.markdown(f"### 🧬 By {rank}")
+                    taxa = pd.DataFrame(rollups.taxa(rank, days), columns=[rank, "Identifications"])
+                    taxa[rank] = taxa[rank].str.title()
+                    st.bar_chart(taxa.head(10).set_index(rank))
+
+            st.markdown("### 🌿 By Host Crop")
+            crops = pd.DataFrame(rollups.crops(days), columns=["Host Crop", "Identifications"])
+            crops["Host Crop"] = crops["Host Crop"].str.title()
+            st.bar_chart(crops.head(15).set_index("Host Crop"))
+
+    # Latency and traffic of the model versions this process is serving
+    with st.expander("🧪 Model versions"):
+        st.dataframe(pd.DataFrame(models.stats()).set_index("version"), use_container_width=True)
+
+    st.markdown("---")
+    if st.button("⬅️ Back to Home", use_container_width=True, key="back_dashboard"):
+         with st.spinner("Wait Loading..."):
+              st.session_state.page = "intro"
+              st.rerun()
+
 def classification_page():
     st.title("🔍 Insect Identification")
     
@@ -480,9 +752,10 @@ def classification_page():
     # ---------------- Centered File Uploader ----------------
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        uploaded_file = st.file_uploader(
+        uploaded_files = st.file_uploader(
             "",
             type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
             label_visibility="collapsed",
             help="Supported: JPG, PNG | Max size: 10MB"
         )
@@ -517,65 +790,186 @@ def classification_page():
     """, unsafe_allow_html=True)
     
     # ---------------- Image Processing (Only if uploaded) ----------------
-    if uploaded_file is not None:
-        image = Image.open(uploaded_file).convert("RGB")
-       
-        # Display uploaded image beautifully
-        st.markdown("<h3 style='text-align: center; color: #2e7d32;'>Uploaded Image</h3>", unsafe_allow_html=True)
-        st.image(image, use_container_width=True, caption="Ready for analysis")
-        
-        # Preprocess and predict
-        img = image.resize((190, 190))
-        img_array = np.array(img)
-        img_array = preprocess_input(img_array)
-        img_array = np.expand_dims(img_array, axis=0)
-        
-        with st.spinner("🤖 AI is analyzing the insect... Please wait a moment"):
-            predictions = model.predict(img_array)
-            predicted_idx = np.argmax(predictions[0])
-            confidence = float(np.max(predictions[0]))  # Safest way: get max prob as clean float
-        
-        st.markdown("---")
-        
-        if predicted_idx >= len(class_names):
-            st.error("⚠️ Unable to classify. Please try a clearer image of a single insect.")
-        else:
-            predicted_class = class_names[predicted_idx]
-            # Confidence bar with animation feel
-            st.success(f"**Identified Species:** {predicted_class}")
-            st.progress(confidence)
-            st.write(f"**Confidence Level:** {confidence:.1%}")
-            
-            # Detailed Info
-            if predicted_class in insect_data:
-                details = insect_data[predicted_class]
-                st.markdown("## 🧬 Taxonomic Classification")
-                col_k, col_p, col_c = st.columns(3)
-                with col_k: st.write(f"**Kingdom:** {details.get('Kingdom', 'N/A')}")
-                with col_k: st.write(f"**Phylum:** {details.get('Phylum', 'N/A')}")
-                with col_k: st.write(f"**Class:** {details.get('Class', 'N/A')}")
-                
-                col_o, col_f = st.columns(2)
-                with col_o: st.write(f"**Order:** {details.get('Order', 'N/A')}")
-                with col_o: st.write(f"**Family:** {details.get('Family', 'N/A')}")
-                
-                st.write(f"**Genus:** {details.get('Genus', 'N/A')}")
-                st.write(f"**Species:** {details.get('Species', 'N/A')}")
-                
-                st.markdown("## 🌿 Host Crops")
-                st.info(details.get("Host Crops", "Not available"))
-                
-                st.markdown("## 🐛 Damage Symptoms")
-                st.warning(details.get("Damage Symptoms", "Not available"))
-                
-                st.markdown("## 🛡️ Integrated Pest Management (IPM)")
-                st.success(details.get("IPM Measures", "Not available"))
-                
-                st.markdown("## ⚠️ Chemical Control (If Needed)")
-                st.error(details.get("Chemical Control", "Not available"))
+    if uploaded_files:
+        # Sessions stick to one model version, so a candidate under A/B test sees whole sessions
+        route_key = st.session_state.setdefault("model_route_key", uuid.uuid4().hex)
+        served = models.route(route_key)
+
+        # A trap card holds many insects: count them all instead of naming one per photo
+        if st.toggle(
+            "🟨 Sticky-trap photo",
+            help="Finds, identifies and counts every insect on a sticky-trap card."
+        ):
+            trap_results(uploaded_files, served)
+            st.markdown("---")
+            col_back1, col_back2, col_back3 = st.columns([1, 1, 1])
+            with col_back2:
+                if st.button("⬅️ Back to Home", use_container_width=True, key="back_trap"):
+                     with st.spinner("Wait Loading..."):
+                        st.session_state.page = "intro"
+                        st.rerun()
+            return
+
+        # Decoded at reduced scale; these previews are never full resolution
+        images = [open_image(f, PREVIEW_SIZE) for f in uploaded_files]
+
+        # ---------------- Analysis Options ----------------
+        multi_view = st.toggle(
+            "🔁 Multi-view analysis",
+            help="Also classifies crops and a mirror image of each photo. Slower, but more reliable on difficult photos."
+        )
+        same_specimen = len(uploaded_files) > 1 and st.toggle(
+            "🧩 All photos show the same insect",
+            help="Combines every photo (e.g. side, top, wings) into a single identification."
+        )
+        check_quality = st.toggle(
+            "✅ Check photo quality first",
+            value=config.QUALITY_GATE,
+            help="Skips photos that are too blurry, dark or empty to identify and explains how to retake them. "
+                 "Turn off to analyse them anyway."
+        )
+
+        # Unusable photos are caught on a small copy before they cost a forward pass
+        rejected = {}
+        if check_quality:
+            for i, (f, image) in enumerate(zip(uploaded_files, images)):
+                issue = photo_issue(f.getvalue(), image)
+                if issue:
+                    rejected[i] = issue
+        accepted = [i for i in range(len(images)) if i not in rejected]
+
+        # Reruns and repeated photos are answered from the prediction cache;
+        # the temperature is part of the key because cached scores are calibrated
+        cache_version = f"{served.version}-T{served.temperature:g}" + ("-multiview" if multi_view else "")
+
+        if same_specimen:
+            # Several angles of one insect give one answer, cached under the photos it was fused from
+            specimen_key = prediction_cache.key(
+                b"".join(hashlib.sha256(uploaded_files[i].getvalue()).digest() for i in accepted),
+                cache_version + "-specimen",
+            )
+            cached = prediction_cache.get(specimen_key) if accepted else None
+            if cached is not None and len(cached) >= config.TOP_K:
+                results, fresh = [cached[:config.TOP_K]], []
+            elif accepted:
+                with st.spinner("🤖 AI is analyzing the insect from every angle... Please wait a moment"):
+                    probabilities = fuse_specimen(predict_images([images[i] for i in accepted], served, multi_view))
+                    top_idx, top_scores = top_k(calibrate(probabilities, served.temperature), config.TOP_K)
+                results = [list(zip(top_idx[0].tolist(), top_scores[0].tolist()))]
+                prediction_cache.put(specimen_key, results[0])
+                metrics.record_prediction(class_names[results[0][0][0]], results[0][0][1])
+                fresh = [0]
             else:
-                st.warning("🔍 Detailed information for this species is not yet available in our database.")
-        
+                results, fresh = [None], []
+            names = [f"{len(uploaded_files)} photos of the same insect"]
+        else:
+            keys = [prediction_cache.key(f.getvalue(), cache_version) for f in uploaded_files]
+            results = [None if i in rejected else prediction_cache.get(key) for i, key in enumerate(keys)]
+            # The HTTP service shares the cache; its entries can be shorter or longer than TOP_K
+            results = [r[:config.TOP_K] if r is not None and len(r) >= config.TOP_K else None for r in results]
+            missing = [i for i in accepted if results[i] is None]
+
+            if missing:
+                with st.spinner("🤖 AI is analyzing the insects... Please wait a moment"):
+                    probabilities = predict_images([images[i] for i in missing], served, multi_view)
+                    top_idx, top_scores = top_k(calibrate(probabilities, served.temperature), config.TOP_K)
+                for row, i in enumerate(missing):
+                    results[i] = list(zip(top_idx[row].tolist(), top_scores[row].tolist()))
+                    prediction_cache.put(keys[i], results[i])
+                    metrics.record_prediction(class_names[results[i][0][0]], results[i][0][1])
+            names = [f.name for f in uploaded_files]
+            fresh = missing
+
+        # Low confidence or "non insects" is reported as unknown for the whole batch at once;
+        # rejected photos get a placeholder row that is never shown
+        placeholder = [(NON_INSECT_INDEX, 0.0)] * config.TOP_K
+        top_idx = np.array([[idx for idx, _ in result or placeholder] for result in results])
+        top_scores = np.array([[score for _, score in result or placeholder] for result in results])
+        unknown = is_unknown(top_idx, top_scores)
+
+        # Only fresh identifications are logged, once per session, so reruns don't duplicate history
+        if history is not None:
+            recorded = st.session_state.setdefault("history_recorded", set())
+            for i in fresh:
+                if same_specimen:
+                    image_hash = hashlib.sha256(b"".join(f.getvalue() for f in uploaded_files)).hexdigest()
+                else:
+                    image_hash = hashlib.sha256(uploaded_files[i].getvalue()).hexdigest()
+                if (image_hash, multi_view) in recorded:
+                    continue
+                recorded.add((image_hash, multi_view))
+                history.record(
+                    image_hash,
+                    [(class_names[idx], score) for idx, score in results[i]],
+                    served.version,
+                    thumbnail=thumbnail_bytes(images[accepted[0] if same_specimen else i]),
+                    unknown=unknown[i],
+                )
+
+        st.markdown("---")
+        st.markdown("<h3 style='text-align: center; color: #2e7d32;'>Results</h3>", unsafe_allow_html=True)
+
+        # Compact grid of thumbnails, three per row
+        for row_start in range(0, len(images), 3):
+            cols = st.columns(3)
+            for col, i in zip(cols, range(row_start, min(row_start + 3, len(images)))):
+                thumbnail = images[i].copy()
+                thumbnail.thumbnail((256, 256))
+                with col:
+                    st.image(thumbnail, use_container_width=True)
+                    # A combined identification applies to every photo
+                    j = 0 if same_specimen else i
+                    if i in rejected:
+                        icon, tip, _ = FEEDBACK[rejected[i]]
+                        st.caption(f"{icon} Retake photo · {tip}")
+                    elif unknown[j]:
+                        st.caption("❓ Not identified")
+                    else:
+                        st.caption(f"**{class_names[top_idx[j, 0]]}** · {float(top_scores[j, 0]):.1%}")
+
+        # Detail cards, one expander per upload (or one for a combined specimen)
+        for i, name in enumerate(names):
+            if results[i] is None:
+                # Never reached the model: explain how to retake instead of guessing
+                with st.expander(f"{i + 1}. {name} — retake photo", expanded=len(names) == 1):
+                    if same_specimen:
+                        for j, issue in rejected.items():
+                            photo_feedback(issue, uploaded_files[j].name)
+                    else:
+                        st.image(images[i], use_container_width=True, caption="Uploaded image")
+                        photo_feedback(rejected[i])
+                continue
+            predicted_class = class_names[top_idx[i, 0]]
+            confidence = float(top_scores[i, 0])
+            label = "not identified" if unknown[i] else f"{predicted_class} ({confidence:.1%})"
+            with st.expander(f"{i + 1}. {name} — {label}", expanded=len(names) == 1):
+                st.image(images[i], use_container_width=True, caption="Uploaded image")
+                if top_idx[i, 0] == NON_INSECT_INDEX:
+                    st.error("⚠️ No insect found in this photo. Please try a clearer image of a single insect.")
+                elif unknown[i]:
+                    st.warning("🤔 We are not confident about this one. Try a closer, sharper photo "
+                               "in natural light — the closest matches are listed below.")
+                else:
+                    # Confidence bar with animation feel
+                    st.success(f"**Identified Species:** {predicted_class}")
+                    st.progress(confidence)
+                    st.write(f"**Confidence Level:** {confidence:.1%}")
+                if same_specimen and rejected:
+                    st.info(f"Based on {len(accepted)} of {len(images)} photos; the others were left out:")
+                    for j, issue in rejected.items():
+                        photo_feedback(issue, uploaded_files[j].name)
+
+                st.markdown("#### 🔢 Top Matches")
+                for rank, (idx, score) in enumerate(results[i], start=1):
+                    common = knowledge_base[idx].get("Common Name", "")
+                    st.write(f"{rank}. **{class_names[idx]}** ({common}) — {score:.1%}")
+
+                if not unknown[i]:
+                    species_details(predicted_class)
+                elif reference_search is not None and top_idx[i, 0] != NON_INSECT_INDEX:
+                    # Unsure: let the user compare with known specimens
+                    reference_gallery(uploaded_files[i].getvalue())
+
         # Back Button after results
         st.markdown("---")
         col_back1, col_back2, col_back3 = st.columns([1, 1, 1])
@@ -613,6 +1007,12 @@ elif st.session_state.page == "features":
     features_page()
 elif st.session_state.page == "developers":
     developers_page()
+elif st.session_state.page == "search":
+    search_page()
+elif st.session_state.page == "history":
+    history_page()
+elif st.session_state.page == "dashboard":
+    dashboard_page()
 
 # --------------------------------------------------
 # Footer
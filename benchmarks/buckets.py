@@ -0,0 +1,105 @@
+"""Re-allocation vs padding cost of the batch scheduler's size buckets.
+
+    python benchmarks/buckets.py --model mobilenetv2_insect.tflite
+    python benchmarks/buckets.py --max-batch-size 16 --buckets 1,2,4,8,16 1,4,16
+
+Measures, for every batch size up to ``--max-batch-size``, the steady
+forward pass (interpreter already allocated at that size) and the extra
+cost of switching to it from another size (resize_tensor_input,
+allocate_tensors and XNNPACK re-preparation). It then replays a random
+mixed-load sequence of batch sizes under each bucket scheme, from no
+padding (every size its own bucket) to padding everything to the maximum,
+and reports the modelled forward-pass milliseconds per batch.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from insectifica import config  # noqa: E402
+from insectifica.inference import TFLiteRunner  # noqa: E402
+
+
+def median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * sorted(times)[len(times) // 2]
+
+
+def measure(runner, max_batch_size, repeats):
+    """``{size: (steady_ms, switch_ms)}`` for every batch size."""
+    rng = np.random.default_rng(0)
+    batches = {n: rng.uniform(-1, 1, size=(n, *runner.input_shape)).astype(np.float32)
+               for n in range(1, max_batch_size + 1)}
+    other = {n: max_batch_size if n == 1 else 1 for n in batches}
+    costs = {}
+    for n, batch in batches.items():
+        runner.predict(batch)
+        steady = median_ms(lambda: runner.predict(batch), repeats)
+        switches = []
+        for _ in range(repeats):
+            runner.predict(batches[other[n]])
+            start = time.perf_counter()
+            runner.predict(batch)
+            switches.append(time.perf_counter() - start)
+        costs[n] = (steady, max(0.0, 1000 * sorted(switches)[len(switches) // 2] - steady))
+    return costs
+
+
+def replay(costs, buckets, sizes):
+    """Modelled ms per batch when ``sizes`` arrive in order and are padded to ``buckets``."""
+    total, current = 0.0, None
+    for n in sizes:
+        bucket = next(b for b in buckets if b >= n)
+        steady, switch = costs[bucket]
+        total += steady + (switch if bucket != current else 0.0)
+        current = bucket
+    return total / len(sizes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--threads", type=int, default=config.NUM_THREADS)
+    parser.add_argument("--max-batch-size", type=int, default=config.BATCH_MAX_SIZE)
+    parser.add_argument("--buckets", nargs="*", default=[],
+                        help="extra comma-separated bucket schemes to compare")
+    parser.add_argument("--batches", type=int, default=1000, help="length of the replayed sequence")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    top = args.max_batch_size
+    costs = measure(TFLiteRunner(args.model, num_threads=args.threads), top, args.repeats)
+    schemes = {
+        "none": list(range(1, top + 1)),
+        "powers_of_two": sorted({2 ** i for i in range(top.bit_length()) if 2 ** i < top} | {top}),
+        "powers_of_four": sorted({4 ** i for i in range(top.bit_length()) if 4 ** i < top} | {top}),
+        "max": [top],
+    }
+    for spec in args.buckets:
+        schemes[spec] = sorted({min(int(b), top) for b in spec.split(",")} | {top})
+
+    # Mixed load: mostly single photos, with the occasional multi-photo upload or burst.
+    rng = np.random.default_rng(0)
+    sizes = np.minimum(rng.geometric(0.35, args.batches), top)
+    report = {
+        "model": args.model,
+        "max_batch_size": top,
+        "mean_batch_size": round(float(sizes.mean()), 2),
+        "per_size_ms": {n: {"steady": round(s, 2), "switch": round(w, 2)} for n, (s, w) in costs.items()},
+        "ms_per_batch": {name: round(replay(costs, buckets, sizes), 2) for name, buckets in schemes.items()},
+    }
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
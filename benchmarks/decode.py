@@ -0,0 +1,98 @@
+"""Decode + resize cost for typical phone photo resolutions.
+
+Compares the original path (full decode, then resize to 190x190) with the
+draft-mode path in insectifica.preprocessing. Every case runs in a fresh
+process so peak RSS belongs to that case alone:
+
+    python benchmarks/decode.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+RESOLUTIONS = {
+    "12MP": (4000, 3000),
+    "24MP": (6000, 4000),
+    "48MP": (8000, 6000),
+}
+
+CASE = """
+import io, json, resource, sys, time
+import numpy as np
+from PIL import Image
+sys.path.insert(0, {root!r})
+from insectifica import preprocessing
+
+data = open({path!r}, "rb").read()
+
+def original():
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    return preprocessing.preprocess_input(np.array(image.resize((190, 190))))
+
+def fast():
+    image = preprocessing.open_image(io.BytesIO(data), preprocessing.PREVIEW_SIZE)
+    return preprocessing.to_model_input(image)
+
+fn = {method}
+fn()
+times = []
+for _ in range({repeats}):
+    t0 = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - t0)
+times.sort()
+try:
+    # ru_maxrss survives exec(), so it would include the parent's peak.
+    status = open("/proc/self/status").read()
+    peak_kb = int(status.split("VmHWM:")[1].split()[0])
+except (OSError, IndexError):
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "ms_per_image": round(1000 * times[len(times) // 2], 1),
+    "peak_rss_mb": round(peak_kb / 1024, 1),
+}}))
+"""
+
+
+def synthetic_jpeg(size, path):
+    # Smooth gradients plus noise compress like a real photo, unlike pure noise.
+    w, h = size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    rgb = np.empty((h, w, 3), dtype=np.uint8)
+    rgb[..., 0] = x
+    rgb[..., 1] = y
+    rgb[..., 2] = (x + y) / 2
+    rgb += np.random.default_rng(0).integers(0, 16, size=(h, w, 1), dtype=np.uint8)
+    Image.fromarray(rgb).save(path, "JPEG", quality=90)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, size in RESOLUTIONS.items():
+            path = os.path.join(tmp, f"{label}.jpg")
+            synthetic_jpeg(size, path)
+            results[label] = {}
+            for method in ("original", "fast"):
+                code = CASE.format(root=root, path=path, method=method, repeats=args.repeats)
+                out = subprocess.run([sys.executable, "-c", code],
+                                     capture_output=True, text=True, check=True)
+                results[label][method] = json.loads(out.stdout)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Closed-loop load generator for the HTTP service.
+
+Starts ``--concurrency`` clients that each POST images back to back for
+``--duration`` seconds, then reports throughput and latency percentiles:
+
+    python -m insectifica.server --port 8000 &
+    python benchmarks/http_load.py --url http://127.0.0.1:8000 --images samples/
+
+Without ``--images`` a few synthetic JPEGs are used. Each request body
+differs, so the server's prediction cache doesn't hide inference cost unless
+``--repeat-images`` is given.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+from PIL import Image
+
+
+def synthetic_images(count, size=(1280, 960)):
+    rng = np.random.default_rng(0)
+    blobs = []
+    for _ in range(count):
+        pixels = rng.integers(0, 255, size=(size[1] // 8, size[0] // 8, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(pixels).resize(size).save(buf, "JPEG", quality=85)
+        blobs.append(buf.getvalue())
+    return blobs
+
+
+def load_images(directory):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith((".jpg", ".jpeg", ".png")))
+    blobs = []
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            blobs.append(f.read())
+    return blobs
+
+
+def client(url, blobs, deadline, repeat, latencies, errors, offset):
+    parts = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    i = offset
+    while time.perf_counter() < deadline:
+        body = blobs[i % len(blobs)]
+        if not repeat:
+            # A unique trailer keeps the JPEG valid but defeats the hash cache.
+            body = body + i.to_bytes(8, "little")
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", "/v1/classify", body=body,
+                         headers={"Content-Type": "image/jpeg"})
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+            conn.close()
+        (latencies if ok else errors).append(time.perf_counter() - t0)
+        i += 1
+
+
+def run_load(url, blobs, concurrency=16, duration=20.0, repeat=False):
+    """Drive the service for ``duration`` seconds; returns the report dict."""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, blobs, deadline, repeat,
+                                              latencies, errors, n * 1000003))
+        for n in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    report = {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+    }
+    if len(ms):
+        report.update({
+            "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p90_ms": round(float(np.percentile(ms, 90)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--images", help="directory of images to send")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--repeat-images", action="store_true")
+    args = parser.parse_args(argv)
+
+    blobs = load_images(args.images) if args.images else synthetic_images(16)
+    report = run_load(args.url, blobs, args.concurrency, args.duration, args.repeat_images)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
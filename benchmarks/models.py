@@ -0,0 +1,101 @@
+"""Accuracy vs latency for the model variants.
+
+    python benchmarks/models.py --data data/val
+    python benchmarks/models.py --models a.tflite b.tflite --data data/val
+
+For each model: file size, top-1/top-5 accuracy over a labelled folder
+(one sub-directory per class name), per-image latency at batch sizes
+1/8/32 and peak RSS. Every model is measured in its own process so peak
+memory isn't shared between them. Without ``--models`` every variant built
+by ``python -m insectifica.quantize`` that exists on disk is measured.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from insectifica import config  # noqa: E402
+
+BATCH_SIZES = (1, 8, 32)
+
+CASE = """
+import json, sys, time
+import numpy as np
+sys.path.insert(0, {root!r})
+from insectifica.inference import TFLiteRunner
+from insectifica.postprocess import top_k
+from insectifica.preprocessing import load_image, preprocess_input
+from insectifica.quantize import iter_labelled
+
+runner = TFLiteRunner({model!r}, num_threads={threads})
+result = {{}}
+
+if {data!r}:
+    samples = list(iter_labelled({data!r}))[:{limit}]
+    top1 = top5 = 0
+    for start in range(0, len(samples), 32):
+        chunk = samples[start:start + 32]
+        batch = np.stack([preprocess_input(load_image(p)) for p, _ in chunk])
+        idx, _ = top_k(runner.predict(batch), 5)
+        labels = np.array([label for _, label in chunk])
+        top1 += int((idx[:, 0] == labels).sum())
+        top5 += int((idx == labels[:, None]).any(axis=1).sum())
+    if samples:
+        result["images"] = len(samples)
+        result["top1"] = round(top1 / len(samples), 4)
+        result["top5"] = round(top5 / len(samples), 4)
+
+rng = np.random.default_rng(0)
+for bs in {batch_sizes!r}:
+    batch = rng.uniform(-1, 1, size=(bs, *runner.input_shape)).astype(np.float32)
+    runner.predict(batch)
+    times = []
+    for _ in range({repeats}):
+        t0 = time.perf_counter()
+        runner.predict(batch)
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    result[f"ms_per_image_bs{{bs}}"] = round(1000 * times[len(times) // 2] / bs, 2)
+
+try:
+    status = open("/proc/self/status").read()
+    result["peak_rss_mb"] = round(int(status.split("VmHWM:")[1].split()[0]) / 1024, 1)
+except (OSError, IndexError):
+    import resource
+    result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+print(json.dumps(result))
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--models", nargs="+")
+    parser.add_argument("--data", default="", help="labelled image folder for accuracy")
+    parser.add_argument("--limit", type=int, default=5000, help="max images for accuracy")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    models = args.models or [
+        p for p in (config.variant_path(v) for v in config.MODEL_VARIANTS) if os.path.exists(p)
+    ]
+    results = {}
+    for model in models:
+        code = CASE.format(root=ROOT, model=os.path.abspath(model), threads=args.threads,
+                           data=args.data and os.path.abspath(args.data), limit=args.limit,
+                           batch_sizes=BATCH_SIZES, repeats=args.repeats)
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if out.returncode != 0:
+            results[model] = {"error": out.stderr.strip().splitlines()[-1]}
+            continue
+        results[model] = {"size_mb": round(os.path.getsize(model) / 1e6, 2), **json.loads(out.stdout)}
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
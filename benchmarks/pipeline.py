@@ -0,0 +1,196 @@
+"""Per-stage and end-to-end timings of the classification pipeline.
+
+Runs on synthetic JPEGs and a stub model, so it needs no GPU, no network and
+no model file. Results are JSON meant to be diffed between commits:
+
+    python benchmarks/pipeline.py --out before.json
+    ... change something ...
+    python benchmarks/pipeline.py --out after.json --compare before.json
+
+``--compare`` flags every timing that got slower by more than ``--tolerance``
+and exits non-zero if any did.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import PIL
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from insectifica import config  # noqa: E402
+from insectifica.postprocess import top_k  # noqa: E402
+from insectifica.preprocessing import (  # noqa: E402
+    PREVIEW_SIZE, open_image, prepare_image, preprocess_input,
+)
+from insectifica.species import load_knowledge_base  # noqa: E402
+
+RESOLUTIONS = {"VGA": (640, 480), "2MP": (1920, 1080), "12MP": (4000, 3000)}
+BATCH_SIZE = 16
+
+
+class StubModel:
+    """Deterministic stand-in for the classifier: pooled colour features -> softmax.
+
+    It keeps the real output shape and dtype so every downstream stage does
+    the same work it would with the real model.
+    """
+
+    def __init__(self, num_classes, seed=0):
+        rng = np.random.default_rng(seed)
+        self.weights = rng.standard_normal((3, num_classes)).astype(np.float32)
+
+    def predict(self, batch):
+        pooled = batch.mean(axis=(1, 2))
+        logits = pooled @ self.weights
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def synthetic_jpeg(size, seed=0):
+    w, h = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 200, w, dtype=np.float32)
+    y = np.linspace(0, 200, h, dtype=np.float32)[:, None]
+    rgb = np.empty((h, w, 3), dtype=np.uint8)
+    rgb[..., 0] = x
+    rgb[..., 1] = y
+    rgb[..., 2] = (x + y) / 2
+    rgb += rng.integers(0, 32, size=(h, w, 1), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(rgb).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def timeit(fn, repeats):
+    fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    return {
+        "median_ms": round(1000 * times[len(times) // 2], 3),
+        "p90_ms": round(1000 * times[int(len(times) * 0.9)], 3),
+    }
+
+
+def bench_resolution(data, model, kb, repeats):
+    image = open_image(io.BytesIO(data), PREVIEW_SIZE)
+    pixels = prepare_image(image)
+    single = preprocess_input(pixels)[None]
+    probabilities = model.predict(single)
+    idx, _ = top_k(probabilities, config.TOP_K)
+    batch = np.repeat(single, BATCH_SIZE, axis=0)
+    batch_probabilities = model.predict(batch)
+
+    def lookup():
+        return [kb[i] for i in idx[0]]
+
+    def pipeline_single():
+        img = open_image(io.BytesIO(data), PREVIEW_SIZE)
+        x = preprocess_input(prepare_image(img))[None]
+        top_idx, _ = top_k(model.predict(x), config.TOP_K)
+        return [kb[i] for i in top_idx[0]]
+
+    def pipeline_batched():
+        out = np.empty((BATCH_SIZE, *single.shape[1:]), dtype=np.float32)
+        for row in range(BATCH_SIZE):
+            img = open_image(io.BytesIO(data), PREVIEW_SIZE)
+            preprocess_input(prepare_image(img), out=out[row])
+        top_idx, _ = top_k(model.predict(out), config.TOP_K)
+        return [[kb[i] for i in r] for r in top_idx]
+
+    batched = timeit(pipeline_batched, max(3, repeats // 4))
+    return {
+        "decode": timeit(lambda: open_image(io.BytesIO(data), PREVIEW_SIZE), repeats),
+        "resize": timeit(lambda: prepare_image(image), repeats),
+        "preprocess": timeit(lambda: preprocess_input(pixels), repeats),
+        "predict": timeit(lambda: model.predict(single), repeats),
+        "predict_batch": timeit(lambda: model.predict(batch), repeats),
+        "top_k": timeit(lambda: top_k(probabilities, config.TOP_K), repeats),
+        "top_k_batch": timeit(lambda: top_k(batch_probabilities, config.TOP_K), repeats),
+        "lookup": timeit(lookup, repeats),
+        "pipeline_single": timeit(pipeline_single, repeats),
+        "pipeline_batched": batched,
+        "pipeline_batched_per_image_ms": round(batched["median_ms"] / BATCH_SIZE, 3),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    regressions = []
+    for res, stages in current["results"].items():
+        for stage, value in stages.items():
+            before = baseline.get("results", {}).get(res, {}).get(stage)
+            if not isinstance(value, dict) or not isinstance(before, dict):
+                continue
+            old, new = before["median_ms"], value["median_ms"]
+            # Sub-0.1 ms stages are mostly timer noise; require an absolute change too.
+            if new > old * (1 + tolerance) and new - old > min_delta_ms:
+                regressions.append(f"{res}/{stage}: {old:.3f} -> {new:.3f} ms (+{new / old - 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--out", default="-")
+    parser.add_argument("--compare", help="earlier JSON output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--min-delta-ms", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    kb = load_knowledge_base(os.path.join(ROOT, "pest.json"))
+    model = StubModel(len(kb))
+    report = {
+        "environment": environment(),
+        "batch_size": BATCH_SIZE,
+        "results": {
+            label: bench_resolution(synthetic_jpeg(size), model, kb, args.repeats)
+            for label, size in RESOLUTIONS.items()
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print("REGRESSION", line, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Query latency and recall of the reference-image IVF index.
+
+Builds an index over synthetic clustered embeddings (or opens an existing
+one with ``--index``) and times single-image queries against it, comparing
+the results with an exact scan of every vector:
+
+    python benchmarks/similarity.py --count 1000000 --dtype int8
+    python benchmarks/similarity.py --index references --nprobe 8 16 32
+
+Synthetic vectors are staged on disk in float16, so the 1M x 1280 default
+needs about 4 GB of free disk and far less RAM.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from insectifica.similarity import ReferenceIndex, normalize, write_index  # noqa: E402
+
+
+def synthetic(path, count, dim, classes=105, chunk=65536, seed=0):
+    """``count`` unit vectors around ``classes`` random directions, written to ``path``."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((classes, dim)))
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=(count, dim))
+    labels = rng.integers(0, classes, count)
+    for start in range(0, count, chunk):
+        block = labels[start:start + chunk]
+        noise = rng.standard_normal((len(block), dim)).astype(np.float32) * 0.04
+        out[start:start + len(block)] = normalize(centres[block] + noise)
+    out.flush()
+    return out, labels
+
+
+def exact(index, queries, k, chunk=65536):
+    """True top-k rows of every query by scanning the whole matrix."""
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(index.vectors), chunk):
+        scores = np.asarray(index.vectors[start:start + chunk], dtype=np.float32) @ queries.T
+        scores = np.concatenate([best_scores, scores.T], axis=1)
+        rows = np.concatenate([best_rows, np.arange(start, start + scores.shape[1] - k)[None]
+                               .repeat(len(queries), 0)], axis=1)
+        top = np.argpartition(scores, -k, axis=1)[:, -k:]
+        best_scores = np.take_along_axis(scores, top, 1)
+        best_rows = np.take_along_axis(rows, top, 1)
+    return best_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", help="existing index prefix (default: build a synthetic one)")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=1280)
+    parser.add_argument("--dtype", choices=["float16", "int8"], default="int8")
+    parser.add_argument("--clusters", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    prefix, workdir, build = args.index, None, {}
+    if prefix is None:
+        workdir = tempfile.mkdtemp(prefix="insectifica-similarity-")
+        prefix = os.path.join(workdir, "references")
+        start = time.perf_counter()
+        vectors, labels = synthetic(prefix + ".staging.npy", args.count, args.dim)
+        paths = [f"ref/{i}.jpg" for i in range(args.count)]
+        generated = time.perf_counter()
+        clusters = write_index(prefix, vectors, labels, paths, args.dtype, args.clusters)
+        del vectors
+        os.remove(prefix + ".staging.npy")
+        build = {"count": args.count, "dim": args.dim, "dtype": args.dtype, "clusters": clusters,
+                 "build_s": round(time.perf_counter() - generated, 1),
+                 "generate_s": round(generated - start, 1)}
+
+    try:
+        report = {"index": build or prefix, **run_queries(ReferenceIndex(prefix), args)}
+    finally:
+        if workdir:
+            shutil.rmtree(workdir)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+def run_queries(index, args):
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(index), args.queries, replace=False)
+    # Queries are perturbed copies of stored vectors, like a new photo of a known specimen.
+    queries = normalize(np.asarray(index.vectors[np.sort(rows)], dtype=np.float32) / index.scale
+                        + rng.standard_normal((args.queries, index.vectors.shape[1])) * 0.02)
+    truth = exact(index, queries, args.k)
+
+    results = []
+    for nprobe in args.nprobe:
+        index.search(queries[0], args.k, nprobe)  # fault in the pages this query touches
+        times, hits = [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            found, _ = index.search(query, args.k, nprobe)
+            times.append(time.perf_counter() - start)
+            hits += len(set(found.tolist()) & set(expected.tolist()))
+        ms = np.array(times) * 1000
+        results.append({
+            "nprobe": nprobe,
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            f"recall@{args.k}": round(hits / (args.k * len(queries)), 3),
+        })
+    return {"vectors": len(index), "queries": results}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Cold-start and time-to-first-prediction timings.
+
+Each measurement runs in a fresh interpreter so module caches don't hide
+import cost. Run from the repository root:
+
+    python benchmarks/startup.py --model mobilenetv2_insect.tflite
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+SNIPPETS = {
+    # What every Streamlit rerun used to import before the first widget.
+    "import_tensorflow": "import tensorflow",
+    # What app.py imports now.
+    "import_app_deps": (
+        "import streamlit, numpy, PIL.Image, json\n"
+        "import insectifica.config, insectifica.inference, insectifica.preprocessing"
+    ),
+    "first_prediction": (
+        "import numpy as np\n"
+        "from insectifica.inference import InterpreterPool\n"
+        "pool = InterpreterPool({model!r}, size=1)\n"
+        "with pool.interpreter() as r:\n"
+        "    r.predict(np.zeros((1, *r.input_shape), dtype=np.float32))"
+    ),
+}
+
+TIMER = """
+import time
+_t0 = time.perf_counter()
+{body}
+print(time.perf_counter() - _t0)
+"""
+
+
+def measure(body, repeats):
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run(
+            [sys.executable, "-c", TIMER.format(body=body)],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            return {"error": out.stderr.strip().splitlines()[-1]}
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    times.sort()
+    return {"min_s": times[0], "median_s": times[len(times) // 2]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="mobilenetv2_insect.tflite")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, snippet in SNIPPETS.items():
+        results[name] = measure(snippet.format(model=args.model), args.repeats)
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
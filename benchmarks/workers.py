@@ -0,0 +1,125 @@
+"""Memory per worker and node throughput of the pre-forked service.
+
+For each worker count, starts ``python -m insectifica.supervisor``, waits
+for it to answer, drives it with the http_load client and samples every
+worker's memory while it is under load:
+
+    python benchmarks/workers.py --model mobilenetv2_insect.tflite --workers 1 2 4 8
+
+RSS counts shared pages in full in every process; PSS splits them between
+the processes mapping them, so PSS summed over the workers is what the node
+actually spends. Run once with INSECTIFICA_SHARED_WEIGHTS=1 and once without
+to see what XNNPACK's private weight copy costs against its speed-up.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+from http_load import load_images, run_load, synthetic_images
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_mb(pid):
+    """``(rss, pss)`` of one process in MB, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values.get("Rss", 0.0), values.get("Pss", 0.0)
+
+
+def wait_ready(url, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/healthz", timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"service at {url} did not come up")
+
+
+def measure(workers, model, blobs, concurrency, duration):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "insectifica.supervisor", "--model", model,
+         "--workers", str(workers), "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(url)
+        # Warm every worker before timing.
+        run_load(url, blobs, concurrency, min(duration, 3.0))
+        samples = []
+        sampler = threading.Timer(duration / 2, lambda: samples.extend(
+            memory_mb(pid) for pid in children(proc.pid)))
+        sampler.start()
+        report = run_load(url, blobs, concurrency, duration)
+        sampler.join()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    rss = [r for r, _ in samples]
+    pss = [p for _, p in samples]
+    return {
+        "workers": workers,
+        "throughput_rps": report["throughput_rps"],
+        "p50_ms": report.get("p50_ms"),
+        "p99_ms": report.get("p99_ms"),
+        "errors": report["errors"],
+        "rss_per_worker_mb": round(sum(rss) / max(len(rss), 1), 1),
+        "pss_per_worker_mb": round(sum(pss) / max(len(pss), 1), 1),
+        "pss_total_mb": round(sum(pss), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="mobilenetv2_insect.tflite")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--images", help="directory of images to send")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    blobs = load_images(args.images) if args.images else synthetic_images(16)
+    print(f"{os.cpu_count()} CPUs, shared weights: "
+          f"{os.environ.get('INSECTIFICA_SHARED_WEIGHTS', '0') == '1'}", file=sys.stderr)
+    results = []
+    for workers in args.workers:
+        result = measure(workers, args.model, blobs, args.concurrency, args.duration)
+        print(json.dumps(result), file=sys.stderr)
+        results.append(result)
+
+    header = ("workers", "throughput_rps", "p50_ms", "p99_ms", "rss_per_worker_mb",
+              "pss_per_worker_mb", "pss_total_mb")
+    print(" | ".join(header))
+    for result in results:
+        print(" | ".join(str(result[key]) for key in header))
+
+
+if __name__ == "__main__":
+    main()
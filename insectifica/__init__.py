@@ -0,0 +1 @@
+"""Inference and data helpers shared by the INSECTIFICA app."""
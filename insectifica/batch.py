@@ -0,0 +1,204 @@
+"""Classify every image in a folder without the Streamlit UI.
+
+    python -m insectifica.batch <dir> --out results.csv
+    python -m insectifica.batch <dir> --out results.jsonl --top-k 5
+
+Images are decoded in a process pool, stacked into fixed-size batches and
+sent through the model once per batch. Results are written as they arrive,
+so the output file can be tailed while a large folder is running.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from insectifica import config
+from insectifica.inference import TFLiteRunner, model_version
+from insectifica.postprocess import load_temperature, postprocess
+from insectifica.preprocessing import load_image, preprocess_input
+from insectifica.species import class_names
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# --------------------------------------------------
+# Input discovery & decoding
+# --------------------------------------------------
+def find_images(root, recursive=True):
+    if not recursive:
+        names = sorted(os.listdir(root))
+        return [os.path.join(root, n) for n in names if n.lower().endswith(IMAGE_EXTENSIONS)]
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(dirpath, name))
+    return paths
+
+
+def _decode(path):
+    try:
+        return path, load_image(path), None
+    except Exception as exc:  # unreadable or truncated files are reported, not fatal
+        return path, None, f"{type(exc).__name__}: {exc}"
+
+
+def iter_batches(paths, batch_size, executor, prefetch=4):
+    """Yield ``(paths, batch, errors)`` with at most ``prefetch`` batches decoding ahead.
+
+    ``batch`` is always ``(batch_size, H, W, 3)`` float32 so the interpreter
+    never has to reallocate; only the first ``len(paths)`` rows are real.
+    """
+    pending = deque()
+    it = iter(paths)
+
+    def submit():
+        chunk = [p for _, p in zip(range(batch_size), it)]
+        if chunk:
+            pending.append([executor.submit(_decode, p) for p in chunk])
+        return bool(chunk)
+
+    for _ in range(prefetch):
+        if not submit():
+            break
+
+    height, width = config.IMAGE_SIZE[1], config.IMAGE_SIZE[0]
+    while pending:
+        futures = pending.popleft()
+        submit()
+        batch = np.zeros((batch_size, height, width, 3), dtype=np.float32)
+        ok_paths, errors = [], []
+        for future in futures:
+            path, pixels, error = future.result()
+            if error is not None:
+                errors.append((path, error))
+                continue
+            preprocess_input(pixels, out=batch[len(ok_paths)])
+            ok_paths.append(path)
+        yield ok_paths, batch, errors
+
+
+# --------------------------------------------------
+# Output sinks
+# --------------------------------------------------
+class CsvSink:
+    def __init__(self, stream, k):
+        self._writer = csv.writer(stream)
+        self._stream = stream
+        header = ["file"]
+        for rank in range(1, k + 1):
+            header += [f"species_{rank}", f"confidence_{rank}"]
+        self._writer.writerow(header + ["unknown", "error"])
+        self._k = k
+
+    def write(self, path, predictions, error=None, unknown=False):
+        row = [path]
+        for species, confidence in predictions:
+            row += [species, f"{confidence:.6f}"]
+        row += [""] * (2 * self._k - 2 * len(predictions))
+        self._writer.writerow(row + [int(unknown) if predictions else "", error or ""])
+
+    def flush(self):
+        self._stream.flush()
+
+
+class JsonlSink:
+    def __init__(self, stream, k):
+        self._stream = stream
+
+    def write(self, path, predictions, error=None, unknown=False):
+        record = {
+            "file": path,
+            "predictions": [{"species": s, "confidence": round(c, 6)} for s, c in predictions],
+            "unknown": bool(unknown),
+            "error": error,
+        }
+        self._stream.write(json.dumps(record) + "\n")
+
+    def flush(self):
+        self._stream.flush()
+
+
+def _sink_for(out, fmt):
+    if fmt is None:
+        fmt = "jsonl" if out.endswith((".jsonl", ".ndjson")) else "csv"
+    return JsonlSink if fmt == "jsonl" else CsvSink
+
+
+# --------------------------------------------------
+# Driver
+# --------------------------------------------------
+def classify_folder(paths, runner, sink, batch_size=32, workers=None, k=3,
+                    temperature=1.0, threshold=None):
+    """Run every path through ``runner`` and write each result to ``sink``.
+
+    Returns ``(classified, failed)`` counts.
+    """
+    classified = failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for ok_paths, batch, errors in iter_batches(paths, batch_size, executor):
+            for path, error in errors:
+                sink.write(path, [], error)
+            failed += len(errors)
+            if ok_paths:
+                probabilities = runner.predict(batch)[: len(ok_paths)]
+                idx, scores, unknown = postprocess(probabilities, k, temperature, threshold)
+                for path, row_idx, row_scores, row_unknown in zip(ok_paths, idx, scores, unknown):
+                    predictions = [(class_names[i], float(s)) for i, s in zip(row_idx, row_scores)]
+                    sink.write(path, predictions, unknown=row_unknown)
+                classified += len(ok_paths)
+            sink.flush()
+    return classified, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.batch",
+                                     description="Classify a folder of insect images.")
+    parser.add_argument("directory")
+    parser.add_argument("--out", default="-", help="CSV or JSONL file, '-' for stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None,
+                        help="defaults to the --out extension, CSV otherwise")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="decode processes (default: one per CPU)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="interpreter threads per forward pass")
+    parser.add_argument("--no-recursive", action="store_true")
+    parser.add_argument("--calibration", default=config.CALIBRATION_PATH)
+    parser.add_argument("--unknown-threshold", type=float, default=config.UNKNOWN_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    paths = find_images(args.directory, recursive=not args.no_recursive)
+    if not paths:
+        parser.error(f"no {'/'.join(IMAGE_EXTENSIONS)} images under {args.directory}")
+
+    runner = TFLiteRunner(args.model, num_threads=args.threads)
+    stream = sys.stdout if args.out == "-" else open(args.out, "w", newline="")
+    sink = _sink_for(args.out, args.format)(stream, args.top_k)
+    start = time.perf_counter()
+    try:
+        classified, failed = classify_folder(
+            paths, runner, sink,
+            batch_size=args.batch_size, workers=args.workers, k=args.top_k,
+            temperature=load_temperature(args.calibration, model_version(args.model)),
+            threshold=args.unknown_threshold,
+        )
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    print(f"{classified} classified, {failed} failed in {elapsed:.1f}s "
+          f"({classified / elapsed:.0f} images/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Top-k predictions keyed by a hash of the image bytes and the model version.
+
+    Lookups hit a bounded in-memory LRU first and then, if ``db_path`` is set,
+    a SQLite table that several processes can share. Values are lists of
+    ``(class_index, confidence)`` pairs, best first.
+
+    The table is pruned when the cache opens and every ``prune_every``
+    inserts: rows older than ``max_age_days`` go first, then the oldest
+    rows beyond ``max_rows``.
+    """
+
+    def __init__(self, max_entries=2048, db_path=None, max_rows=None, max_age_days=None, prune_every=1000):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        self.prune_every = prune_every
+        self._inserts = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            with self._db() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS predictions_created ON predictions (created)")
+            self.prune()
+
+    @staticmethod
+    def key(data, model_version):
+        digest = hashlib.sha256(data).hexdigest()
+        return f"{model_version}:{digest}"
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.db_path:
+            row = self._db().execute(
+                "SELECT value FROM predictions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value = [tuple(pair) for pair in json.loads(row[0])]
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        value = [(int(i), float(score)) for i, score in value]
+        self._remember(key, value)
+        if self.db_path:
+            with self._db() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO predictions (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time()),
+                )
+            with self._lock:
+                self._inserts += 1
+                due = self._inserts % self.prune_every == 0
+            if due:
+                self.prune()
+
+    def prune(self):
+        """Delete expired and surplus rows from the SQLite table; returns how many went."""
+        if not self.db_path:
+            return 0
+        removed = 0
+        with self._db() as conn:
+            if self.max_age_days:
+                removed += conn.execute(
+                    "DELETE FROM predictions WHERE created < ?",
+                    (time.time() - self.max_age_days * 86400,),
+                ).rowcount
+            if self.max_rows:
+                removed += conn.execute(
+                    "DELETE FROM predictions WHERE key IN ("
+                    " SELECT key FROM predictions ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_rows,),
+                ).rowcount
+        return removed
@@ -0,0 +1,102 @@
+"""Fit the temperature used to calibrate confidences.
+
+    python -m insectifica.calibrate --data data/val
+
+Runs the model over a held-out labelled folder (one sub-directory per class
+name), picks the temperature that minimises negative log-likelihood and
+writes it to calibration.json together with before/after NLL and expected
+calibration error. The app, the batch CLI and the HTTP service read that
+file at start-up, as long as it was fitted on the model they serve.
+
+With a model registry, calibrate each version instead; the result is stored
+in that version's manifest and follows it through hot swaps and A/B tests:
+
+    python -m insectifica.calibrate --data data/val --version 2026-11-02
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from insectifica import config
+from insectifica.inference import TFLiteRunner, model_version
+from insectifica.postprocess import negative_log_likelihood, calibrate, fit_temperature
+from insectifica.preprocessing import load_image, preprocess_input
+from insectifica.quantize import iter_labelled
+
+
+def expected_calibration_error(probabilities, labels, bins=15):
+    confidence = probabilities.max(axis=1)
+    correct = probabilities.argmax(axis=1) == labels
+    edges = np.linspace(0, 1, bins + 1)
+    which = np.clip(np.digitize(confidence, edges[1:-1]), 0, bins - 1)
+    error = 0.0
+    for b in range(bins):
+        mask = which == b
+        if mask.any():
+            error += mask.mean() * abs(confidence[mask].mean() - correct[mask].mean())
+    return float(error)
+
+
+def collect(predict, root, batch_size=32):
+    """Model probabilities and labels for a labelled folder; ``predict`` takes a preprocessed batch."""
+    samples = list(iter_labelled(root))
+    if not samples:
+        raise SystemExit(f"no labelled images under {root}")
+    outputs = []
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start:start + batch_size]
+        batch = np.stack([preprocess_input(load_image(path)) for path, _ in chunk])
+        outputs.append(predict(batch))
+    return np.concatenate(outputs), np.array([label for _, label in samples])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.calibrate",
+                                     description="Fit confidence temperature on labelled images.")
+    parser.add_argument("--data", required=True, help="labelled image folder")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--out", default=config.CALIBRATION_PATH)
+    parser.add_argument("--version", help="calibrate this model registry version (instead of --model) "
+                                          "and store the result in its manifest")
+    parser.add_argument("--root", default=config.MODEL_REGISTRY or "models", help="registry directory")
+    args = parser.parse_args(argv)
+
+    if args.version:
+        from insectifica import registry
+
+        # Through the version's own forward pass, which puts its output columns
+        # in class_names order like the labels.
+        served = registry.ModelVersion.from_registry(args.root, args.version, pool_size=1,
+                                                     num_threads=os.cpu_count())
+        args.model = served.model_path
+        try:
+            probabilities, labels = collect(lambda batch: served.predict(batch, scheduled=False), args.data)
+        finally:
+            served.retire()
+    else:
+        runner = TFLiteRunner(args.model, num_threads=os.cpu_count())
+        probabilities, labels = collect(runner.predict, args.data)
+    temperature = fit_temperature(probabilities, labels)
+    calibrated = calibrate(probabilities, temperature)
+    report = {
+        "temperature": round(temperature, 4),
+        "model_version": model_version(args.model),
+        "samples": int(len(labels)),
+        "nll_before": round(negative_log_likelihood(probabilities, labels, 1.0), 4),
+        "nll_after": round(negative_log_likelihood(probabilities, labels, temperature), 4),
+        "ece_before": round(expected_calibration_error(probabilities, labels), 4),
+        "ece_after": round(expected_calibration_error(calibrated, labels), 4),
+    }
+    if args.version:
+        registry.write_calibration(args.root, args.version, report)
+    else:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
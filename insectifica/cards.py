@@ -0,0 +1,76 @@
+"""Pre-rendered species detail cards.
+
+Every species gets one HTML fragment covering its taxonomy, host crops,
+damage, IPM and chemical control, built once per knowledge-base version.
+Showing a card is then a single markdown element per rerun instead of a
+dozen widgets, each of which Streamlit would re-serialise and send.
+"""
+import html
+
+from insectifica import metrics
+
+# Taxonomy rows, grouped the way the detail view lays them out.
+TAXONOMY = (
+    ("Kingdom", "Phylum", "Class"),
+    ("Order", "Family"),
+    ("Genus", "Species"),
+)
+
+# (heading, field, box style, text shown when the field is empty)
+SECTIONS = (
+    ("🌿 Host Crops", "Host Crops", "info", "Not available"),
+    ("🐛 Damage Symptoms", "Damage Symptoms", "warning", "Not available"),
+    ("🛡️ Integrated Pest Management (IPM)", "IPM Measures", "success", "Not available"),
+    ("⚠️ Chemical Control (If Needed)", "Chemical Control", "error", "Not available"),
+)
+
+CARD_CSS = """
+.species-card .taxonomy {
+    display: grid;
+    grid-template-columns: repeat(auto-fit, minmax(180px, 1fr));
+    gap: 4px 16px;
+    margin-bottom: 12px;
+}
+.species-card .box {
+    border-radius: 8px;
+    padding: 14px 16px;
+    margin-bottom: 16px;
+}
+.species-card .box.info {background: rgba(28, 131, 225, 0.1); color: #004280;}
+.species-card .box.warning {background: rgba(255, 189, 69, 0.2); color: #926c05;}
+.species-card .box.success {background: rgba(33, 195, 84, 0.1); color: #177233;}
+.species-card .box.error {background: rgba(255, 43, 43, 0.09); color: #7d353b;}
+"""
+
+
+def _text(record, field, default="N/A"):
+    value = str(record.get(field) or "").strip()
+    return html.escape(value or default)
+
+
+def render_card(record):
+    """HTML for one species record."""
+    parts = ['<div class="species-card">', "<h2>🧬 Taxonomic Classification</h2>"]
+    for fields in TAXONOMY:
+        parts.append('<div class="taxonomy">')
+        parts.extend(f"<div><b>{field}:</b> {_text(record, field)}</div>" for field in fields)
+        parts.append("</div>")
+    for heading, field, style, default in SECTIONS:
+        parts.append(f"<h2>{heading}</h2>")
+        parts.append(f'<div class="box {style}">{_text(record, field, default)}</div>')
+    parts.append("</div>")
+    return "\n".join(parts)
+
+
+class SpeciesCards:
+    """Rendered cards for every species in a knowledge base."""
+
+    def __init__(self, knowledge_base):
+        self.version = knowledge_base.version
+        self._cards = {name: render_card(knowledge_base[i])
+                       for i, name in enumerate(knowledge_base.class_names)}
+
+    def get(self, name):
+        # Recorded as the "lookup" stage, like KnowledgeBase.get which it replaces in the app.
+        with metrics.stage("lookup"):
+            return self._cards.get(name)
@@ -0,0 +1,107 @@
+import os
+
+# --------------------------------------------------
+# Runtime settings (overridable through the environment)
+# --------------------------------------------------
+# Which artifact the app serves when there is no model registry: "float32" is
+# the original export, the others are produced by ``python -m insectifica.quantize``.
+MODEL_VARIANTS = ("float32", "dynamic", "float16", "int8")
+MODEL_VARIANT = os.environ.get("INSECTIFICA_MODEL_VARIANT", "float32")
+if MODEL_VARIANT not in MODEL_VARIANTS:
+    raise ValueError(f"INSECTIFICA_MODEL_VARIANT must be one of {', '.join(MODEL_VARIANTS)}")
+
+
+def variant_path(variant, base="mobilenetv2_insect.tflite"):
+    stem, ext = os.path.splitext(base)
+    return base if variant == "float32" else f"{stem}.{variant}{ext}"
+
+
+MODEL_PATH = os.environ.get("INSECTIFICA_MODEL_PATH") or variant_path(MODEL_VARIANT)
+
+# Number of pre-allocated TFLite interpreters shared by all sessions.
+POOL_SIZE = int(os.environ.get("INSECTIFICA_POOL_SIZE", min(4, os.cpu_count() or 1)))
+
+# Threads each interpreter may use for a single invoke().
+NUM_THREADS = int(os.environ.get("INSECTIFICA_NUM_THREADS", 1))
+
+IMAGE_SIZE = (190, 190)
+
+# Load and warm the model on a background thread while the intro page renders.
+WARMUP = os.environ.get("INSECTIFICA_WARMUP", "1") != "0"
+
+# Number of ranked predictions kept per image.
+TOP_K = int(os.environ.get("INSECTIFICA_TOP_K", 3))
+
+# Prediction cache: in-memory LRU entries, plus an optional SQLite file shared
+# by every worker process on the node.
+CACHE_SIZE = int(os.environ.get("INSECTIFICA_CACHE_SIZE", 2048))
+CACHE_DB = os.environ.get("INSECTIFICA_CACHE_DB") or None
+# Bounds on the SQLite file: rows kept, and age in days after which rows expire
+# (0 disables either).
+CACHE_DB_MAX_ROWS = int(os.environ.get("INSECTIFICA_CACHE_DB_MAX_ROWS", 100000))
+CACHE_DB_MAX_AGE_DAYS = float(os.environ.get("INSECTIFICA_CACHE_DB_MAX_AGE_DAYS", 30))
+
+# Species knowledge base (one record per entry of class_names).
+SPECIES_PATH = os.environ.get("INSECTIFICA_SPECIES_PATH", "pest.json")
+
+# HTTP service: inference processes and requests allowed in flight at once.
+SERVER_WORKERS = int(os.environ.get("INSECTIFICA_SERVER_WORKERS", os.cpu_count() or 1))
+SERVER_MAX_CONCURRENCY = int(os.environ.get("INSECTIFICA_SERVER_MAX_CONCURRENCY", 32))
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+# Images accepted in one /v1/classify:batch request; with MAX_UPLOAD_BYTES this
+# bounds how much of a request body is read.
+SERVER_MAX_BATCH_IMAGES = int(os.environ.get("INSECTIFICA_SERVER_MAX_BATCH_IMAGES", 32))
+
+# Run interpreters without the XNNPACK delegate, which repacks the weights into
+# private memory; the kernels then read them from the memory-mapped .tflite file,
+# whose pages are shared by every process on the node. Slower per image.
+SHARED_WEIGHTS = os.environ.get("INSECTIFICA_SHARED_WEIGHTS", "0") == "1"
+
+# Micro-batching of concurrent sessions: a forward pass starts once this many
+# images are queued or the oldest has waited this long.
+BATCH_MAX_SIZE = int(os.environ.get("INSECTIFICA_BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("INSECTIFICA_BATCH_MAX_WAIT_MS", 10))
+# Batch sizes a pass is padded up to, e.g. "1,2,4,8,16" (the default: powers of
+# two); see benchmarks/buckets.py.
+BATCH_BUCKETS = [int(b) for b in os.environ.get("INSECTIFICA_BATCH_BUCKETS", "").split(",") if b.strip()] or None
+
+# Instrumentation (see insectifica.metrics); off unless asked for.
+METRICS = os.environ.get("INSECTIFICA_METRICS", "0") == "1"
+METRICS_PORT = int(os.environ.get("INSECTIFICA_METRICS_PORT", 0))
+METRICS_JSON_LOG = os.environ.get("INSECTIFICA_METRICS_JSON_LOG", "0") == "1"
+
+# Post-processing: temperature fitted by ``python -m insectifica.calibrate``
+# and the calibrated top-1 confidence below which a result is "unknown".
+CALIBRATION_PATH = os.environ.get("INSECTIFICA_CALIBRATION_PATH", "calibration.json")
+UNKNOWN_THRESHOLD = float(os.environ.get("INSECTIFICA_UNKNOWN_THRESHOLD", 0.4))
+
+# Identification history (SQLite, WAL mode); empty disables recording.
+HISTORY_DB = os.environ.get("INSECTIFICA_HISTORY_DB", "history.db")
+
+# Reference-image similarity: embedding model and IVF index built by
+# ``python -m insectifica.similarity``; the UI shows REFERENCE_NEIGHBOURS
+# specimens for unsure results when both exist.
+EMBEDDING_MODEL_PATH = os.environ.get("INSECTIFICA_EMBEDDING_MODEL_PATH", "mobilenetv2_insect.embedding.tflite")
+REFERENCE_INDEX = os.environ.get("INSECTIFICA_REFERENCE_INDEX", "references")
+REFERENCE_NPROBE = int(os.environ.get("INSECTIFICA_REFERENCE_NPROBE", 32))
+REFERENCE_NEIGHBOURS = int(os.environ.get("INSECTIFICA_REFERENCE_NEIGHBOURS", 4))
+
+# Photo quality gate in front of the model (see insectifica.quality): minimum
+# Laplacian variance of the sharpest tile, maximum share of near-black and of
+# clipped pixels, and minimum share of pixels standing out from the background.
+QUALITY_GATE = os.environ.get("INSECTIFICA_QUALITY_GATE", "1") == "1"
+QUALITY_MIN_SHARPNESS = float(os.environ.get("INSECTIFICA_QUALITY_MIN_SHARPNESS", 40))
+QUALITY_MAX_DARK = float(os.environ.get("INSECTIFICA_QUALITY_MAX_DARK", 0.8))
+QUALITY_MAX_CLIPPED = float(os.environ.get("INSECTIFICA_QUALITY_MAX_CLIPPED", 0.5))
+QUALITY_MIN_FOREGROUND = float(os.environ.get("INSECTIFICA_QUALITY_MIN_FOREGROUND", 0.01))
+
+# Versioned model registry (see insectifica.registry). When set, the app serves
+# what its routing.json names and hot-swaps within MODEL_REGISTRY_POLL seconds
+# of a change; when empty, MODEL_PATH is served as the only version.
+MODEL_REGISTRY = os.environ.get("INSECTIFICA_MODEL_REGISTRY", "")
+MODEL_REGISTRY_POLL = float(os.environ.get("INSECTIFICA_MODEL_REGISTRY_POLL", 5))
+
+# Sticky-trap counting (see insectifica.traps): longest side trap photos are
+# decoded at for cropping, and crops per forward pass.
+TRAP_MAX_SIZE = int(os.environ.get("INSECTIFICA_TRAP_MAX_SIZE", 4096))
+TRAP_BATCH_SIZE = int(os.environ.get("INSECTIFICA_TRAP_BATCH_SIZE", 64))
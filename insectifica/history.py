@@ -0,0 +1,253 @@
+"""Append-only identification history in SQLite.
+
+    python -m insectifica.history export history.xlsx
+    python -m insectifica.history export history.csv
+
+Writes are queued and committed in batches by a background thread, so the
+request path never waits on disk. Reads use keyset pagination on indexed
+columns and exports stream rows in chunks, so neither grows with the size
+of the table.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from insectifica import config
+
+logger = logging.getLogger("insectifica.history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identifications (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    image_hash TEXT NOT NULL,
+    thumbnail BLOB,
+    species TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    unknown INTEGER NOT NULL DEFAULT 0,
+    predictions TEXT NOT NULL,
+    model_version TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_identifications_created ON identifications (created);
+CREATE INDEX IF NOT EXISTS idx_identifications_species ON identifications (species, id);
+CREATE INDEX IF NOT EXISTS idx_identifications_hash ON identifications (image_hash);
+"""
+
+THUMBNAIL_SIZE = (128, 128)
+
+EXPORT_COLUMNS = ("id", "created", "image_hash", "species", "confidence", "unknown",
+                  "predictions", "model_version")
+
+_STOP = object()
+
+
+class HistoryStore:
+    """Identification log with a batching background writer.
+
+    ``record`` only enqueues; the writer thread commits up to ``batch_size``
+    rows per transaction, waiting at most ``flush_interval`` seconds for a
+    batch to fill.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._listeners = []
+        self._local = threading.local()
+        with self._db() as conn:
+            conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._run, name="insectifica-history", daemon=True)
+        self._writer.start()
+
+    def _db(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def connection(self):
+        """This thread's connection to the history database."""
+        return self._db()
+
+    def add_listener(self, fn):
+        """Call ``fn(conn, rows)`` inside every write transaction.
+
+        ``rows`` are the ``(created, species, unknown)`` of the batch being
+        committed, so derived tables stay consistent with the log. A listener
+        that raises has its own changes rolled back and is logged; the batch
+        is still committed.
+        """
+        self._listeners.append(fn)
+
+    # ---------------- writing ----------------
+    def record(self, image_hash, predictions, model_version, thumbnail=None, unknown=False,
+               created=None):
+        """Queue one identification; ``predictions`` is ``[(species, confidence), ...]`` best first."""
+        species, confidence = predictions[0]
+        self._queue.put((
+            created or time.time(), image_hash, thumbnail, species, float(confidence),
+            int(bool(unknown)), json.dumps([[s, round(float(c), 6)] for s, c in predictions]),
+            model_version,
+        ))
+
+    def flush(self):
+        """Block until everything queued so far is committed."""
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _run(self):
+        conn = self._db()
+        while True:
+            item = self._queue.get()
+            rows = [] if item is _STOP else [item]
+            stop = item is _STOP
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(rows) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 \
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                rows.append(item)
+            try:
+                if rows:
+                    self._write(conn, rows)
+            except Exception:
+                # Keep the only writer alive; the batch is lost, later ones aren't.
+                logger.exception("could not write %d history row(s)", len(rows))
+            finally:
+                for _ in range(len(rows) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, conn, rows):
+        with conn:
+            conn.executemany(
+                "INSERT INTO identifications (created, image_hash, thumbnail, species,"
+                " confidence, unknown, predictions, model_version)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+            summary = [(row[0], row[3], row[5]) for row in rows]
+            for listener in self._listeners:
+                conn.execute("SAVEPOINT listener")
+                try:
+                    listener(conn, summary)
+                except Exception:
+                    conn.execute("ROLLBACK TO listener")
+                    logger.exception("history listener %r failed", listener)
+                conn.execute("RELEASE listener")
+
+    # ---------------- reading ----------------
+    def count(self, species=None):
+        if species:
+            sql, args = "SELECT COUNT(*) FROM identifications WHERE species = ?", (species,)
+        else:
+            sql, args = "SELECT COUNT(*) FROM identifications", ()
+        return self._db().execute(sql, args).fetchone()[0]
+
+    def page(self, before_id=None, limit=20, species=None):
+        """Newest-first rows with ``id < before_id``; pass the last id back for the next page."""
+        where, args = [], []
+        if before_id is not None:
+            where.append("id < ?")
+            args.append(before_id)
+        if species:
+            where.append("species = ?")
+            args.append(species)
+        sql = "SELECT * FROM identifications"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        return [dict(row) for row in self._db().execute(sql, (*args, limit))]
+
+    def iter_rows(self, chunk_size=1000):
+        """Every row in id order, fetched ``chunk_size`` at a time, without thumbnails."""
+        cursor = self._db().execute(
+            f"SELECT {', '.join(EXPORT_COLUMNS)} FROM identifications ORDER BY id"
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            for row in rows:
+                yield tuple(row)
+
+    # ---------------- export ----------------
+    def export_csv(self, stream):
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_COLUMNS)
+        for row in self.iter_rows():
+            writer.writerow(_export_row(row))
+
+    def export_xlsx(self, target):
+        from openpyxl import Workbook
+
+        # write_only workbooks stream rows to disk instead of building the sheet in memory.
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Identifications")
+        sheet.append(EXPORT_COLUMNS)
+        for row in self.iter_rows():
+            sheet.append(_export_row(row))
+        workbook.save(target)
+
+
+def thumbnail_bytes(image, size=THUMBNAIL_SIZE):
+    """Small JPEG of a PIL image, the form ``record`` stores."""
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail(size)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def _export_row(row):
+    row = list(row)
+    row[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row[1]))
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.history",
+                                     description="Export the identification history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="write every identification to CSV or XLSX")
+    export.add_argument("out", help="*.csv, *.xlsx or '-' for CSV on stdout")
+    parser.add_argument("--db", default=config.HISTORY_DB)
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    try:
+        if args.out == "-":
+            store.export_csv(sys.stdout)
+        elif args.out.endswith(".xlsx"):
+            store.export_xlsx(args.out)
+        else:
+            with open(args.out, "w", newline="") as f:
+                store.export_csv(f)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
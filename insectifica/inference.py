@@ -0,0 +1,194 @@
+import functools
+import hashlib
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from insectifica import config, metrics
+
+
+def model_version(path):
+    """Short content hash of a model file, used to key cached predictions."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+# --------------------------------------------------
+# Interpreter backend
+# --------------------------------------------------
+def _interpreter_class():
+    # tflite-runtime is a few MB; full TensorFlow is only the fallback.
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _builtin_resolver():
+    # Op resolver that leaves out the default (XNNPACK) delegate.
+    try:
+        from tflite_runtime.interpreter import OpResolverType
+    except ImportError:
+        import tensorflow as tf
+        OpResolverType = tf.lite.experimental.OpResolverType
+    return OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+
+
+class TFLiteRunner:
+    """One allocated interpreter plus the bookkeeping needed to call it.
+
+    TFLite maps ``model_path`` read-only rather than reading it, so the
+    weights live in the page cache; ``shared_weights`` keeps them there
+    instead of letting XNNPACK pack a private copy per interpreter.
+    """
+
+    def __init__(self, model_path, num_threads=1, shared_weights=None):
+        start = time.perf_counter()
+        Interpreter = _interpreter_class()
+        kwargs = {}
+        if config.SHARED_WEIGHTS if shared_weights is None else shared_weights:
+            kwargs["experimental_op_resolver_type"] = _builtin_resolver()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads, **kwargs)
+        self.interpreter.allocate_tensors()
+        metrics.record_model_load(time.perf_counter() - start)
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+
+    @property
+    def input_shape(self):
+        return tuple(int(d) for d in self._input["shape"][1:])
+
+    def _resize(self, batch_size):
+        if batch_size == self._batch_size:
+            return
+        shape = [batch_size, *self.input_shape]
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def _quantize(self, batch):
+        dtype = self._input["dtype"]
+        scale, zero_point = self._input["quantization"]
+        if np.issubdtype(dtype, np.integer) and scale:
+            # Full-integer models take quantized pixels; callers always pass float32.
+            info = np.iinfo(dtype)
+            batch = np.round(np.asarray(batch, dtype=np.float32) / scale + zero_point)
+            batch = np.clip(batch, info.min, info.max)
+        return np.asarray(batch, dtype=dtype)
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output["quantization"]
+        if np.issubdtype(output.dtype, np.integer) and scale:
+            return (output.astype(np.float32) - zero_point) * np.float32(scale)
+        return output
+
+    def predict(self, batch):
+        with metrics.stage("predict"):
+            batch = self._quantize(batch)
+            self._resize(batch.shape[0])
+            self.interpreter.set_tensor(self._input["index"], batch)
+            self.interpreter.invoke()
+            # get_tensor returns a copy, so the result survives the next invoke().
+            return self._dequantize(self.interpreter.get_tensor(self._output["index"]))
+
+
+# --------------------------------------------------
+# Interpreter pool
+# --------------------------------------------------
+class InterpreterPool:
+    """Bounded pool of interpreters shared across Streamlit sessions.
+
+    TFLite interpreters are not thread-safe, so each caller borrows one for
+    the duration of a forward pass. Interpreters are created on demand up to
+    ``size`` and then reused.
+    """
+
+    def __init__(self, model_path=None, size=None, num_threads=None):
+        self.model_path = model_path or config.MODEL_PATH
+        self.size = size or config.POOL_SIZE
+        self.num_threads = num_threads or config.NUM_THREADS
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def version(self):
+        return model_version(self.model_path)
+
+    def _new_runner(self):
+        return TFLiteRunner(self.model_path, num_threads=self.num_threads)
+
+    def _acquire(self, timeout):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_runner()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    @contextmanager
+    def interpreter(self, timeout=None):
+        runner = self._acquire(timeout)
+        try:
+            yield runner
+        finally:
+            self._idle.put(runner)
+
+    def predict(self, batch):
+        with self.interpreter() as runner:
+            return runner.predict(batch)
+
+    def warm(self, count=1, invoke=False):
+        """Create ``count`` interpreters up front so first requests skip allocation.
+
+        With ``invoke`` each also runs one dummy inference, which settles
+        lazily initialised kernels and delegates before real traffic arrives.
+        """
+        runners = []
+        for _ in range(min(count, self.size)):
+            runners.append(self._acquire(timeout=None))
+        try:
+            if invoke:
+                for runner in runners:
+                    runner.predict(np.zeros((1, *runner.input_shape), dtype=np.float32))
+        finally:
+            for runner in runners:
+                self._idle.put(runner)
+
+
+# --------------------------------------------------
+# Background warm-up
+# --------------------------------------------------
+def _warm(pool):
+    with pool.interpreter() as runner:
+        runner.predict(np.zeros((1, *runner.input_shape), dtype=np.float32))
+
+
+def start_warmup(pool):
+    """Load the interpreter backend and run one dummy inference off the UI thread."""
+    thread = threading.Thread(target=_warm, args=(pool,), name="insectifica-warmup", daemon=True)
+    thread.start()
+    return thread
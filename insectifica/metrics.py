@@ -0,0 +1,261 @@
+"""Opt-in hot-path instrumentation with Prometheus text export.
+
+Enable with INSECTIFICA_METRICS=1. While disabled, ``stage()`` hands back a
+shared no-op context manager and the record helpers return straight away,
+so instrumented code pays one attribute check.
+
+    with metrics.stage("decode"):
+        image = open_image(upload)
+
+Set INSECTIFICA_METRICS_PORT to serve /metrics from a background thread
+(the HTTP service exposes /metrics itself) and INSECTIFICA_METRICS_JSON_LOG=1
+to also log every observation as one JSON object on the
+``insectifica.metrics`` logger.
+"""
+import contextlib
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from insectifica import config
+
+ENABLED = config.METRICS
+JSON_LOG = config.METRICS_JSON_LOG
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("insectifica.metrics")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+# --------------------------------------------------
+# Metric types
+# --------------------------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name + _labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self.fn is not None:
+            yield self.name, self.fn()
+            return
+        yield from super().samples()
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _labels(self.labels + ("le",), label_values + (_number(bound),))
+                yield f"{self.name}_bucket{labels}", cumulative
+            base = _labels(self.labels, label_values)
+            yield f"{self.name}_sum{base}", total
+            yield f"{self.name}_count{base}", count
+
+
+# --------------------------------------------------
+# Registry
+# --------------------------------------------------
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+STAGE_SECONDS = register(Histogram(
+    "insectifica_stage_seconds", "Latency of each classification stage.", labels=("stage",)))
+PREDICTIONS = register(Counter(
+    "insectifica_predictions_total", "Top-1 predictions by species.", labels=("species",)))
+REJECTIONS = register(Counter(
+    "insectifica_rejections_total", "Images rejected instead of identified.", labels=("reason",)))
+MODEL_LOAD_SECONDS = register(Gauge(
+    "insectifica_model_load_seconds", "Time taken by the most recent interpreter load."))
+BATCH_SIZE = register(Histogram(
+    "insectifica_batch_size", "Images per forward pass formed by the scheduler.",
+    buckets=(1, 2, 4, 8, 16, 32, 64)))
+MODEL_SECONDS = register(Histogram(
+    "insectifica_model_seconds", "Prediction latency by model version, queueing included.",
+    labels=("version",)))
+SHADOW_PREDICTIONS = register(Counter(
+    "insectifica_shadow_predictions_total", "Candidate-model shadow predictions by top-1 agreement.",
+    labels=("version", "agrees")))
+
+
+def render_prometheus():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{name} {_number(value)}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------
+# Recording helpers
+# --------------------------------------------------
+_NOOP = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """Time the enclosed block as ``stage``; a shared no-op when metrics are off."""
+    return _Stage(name) if ENABLED else _NOOP
+
+
+def observe_stage(name, seconds):
+    if not ENABLED:
+        return
+    STAGE_SECONDS.observe(name, value=seconds)
+    if JSON_LOG:
+        logger.info(json.dumps({"event": "stage", "stage": name, "seconds": round(seconds, 6)}))
+
+
+def record_model_load(seconds):
+    if not ENABLED:
+        return
+    MODEL_LOAD_SECONDS.set(value=seconds)
+    observe_stage("model_load", seconds)
+
+
+def record_prediction(species, confidence=None):
+    if not ENABLED:
+        return
+    PREDICTIONS.inc(species)
+    if species == "non insects":
+        REJECTIONS.inc("non_insect")
+    if JSON_LOG:
+        logger.info(json.dumps({"event": "prediction", "species": species, "confidence": confidence}))
+
+
+def record_model_latency(version, seconds):
+    if ENABLED:
+        MODEL_SECONDS.observe(version, value=seconds)
+
+
+def record_shadow(version, agreeing, total):
+    if not ENABLED:
+        return
+    SHADOW_PREDICTIONS.inc(version, "true", amount=agreeing)
+    SHADOW_PREDICTIONS.inc(version, "false", amount=total - agreeing)
+
+
+def record_batch(size):
+    if ENABLED:
+        BATCH_SIZE.observe(value=size)
+
+
+def record_rejection(reason):
+    if not ENABLED:
+        return
+    REJECTIONS.inc(reason)
+    if JSON_LOG:
+        logger.info(json.dumps({"event": "rejection", "reason": reason}))
+
+
+# --------------------------------------------------
+# Standalone endpoint
+# --------------------------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread; returns the server so tests can shut it down."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name="insectifica-metrics", daemon=True)
+    thread.start()
+    return server
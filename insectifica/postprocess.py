@@ -0,0 +1,104 @@
+import json
+import math
+import os
+
+import numpy as np
+
+from insectifica import config
+from insectifica.species import NON_INSECT, class_names
+
+NON_INSECT_INDEX = class_names.index(NON_INSECT)
+
+
+def top_k(probabilities, k=3):
+    """Indices and scores of the ``k`` best classes for every row of a batch.
+
+    Both arrays have shape ``(batch, k)`` and are sorted best first.
+    """
+    probabilities = np.asarray(probabilities)
+    k = min(k, probabilities.shape[-1])
+    idx = np.argpartition(probabilities, -k, axis=-1)[:, -k:]
+    scores = np.take_along_axis(probabilities, idx, axis=-1)
+    order = np.argsort(-scores, axis=-1)
+    return np.take_along_axis(idx, order, axis=-1), np.take_along_axis(scores, order, axis=-1)
+
+
+# --------------------------------------------------
+# Temperature scaling
+# --------------------------------------------------
+def calibrate(probabilities, temperature=1.0):
+    """Re-soften a batch of softmax outputs as if the logits were divided by ``temperature``."""
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    if temperature == 1.0:
+        return probabilities
+    logits = np.log(np.clip(probabilities, 1e-12, None)) / np.float32(temperature)
+    logits -= logits.max(axis=-1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=-1, keepdims=True)
+    return logits
+
+
+def negative_log_likelihood(probabilities, labels, temperature):
+    calibrated = calibrate(probabilities, temperature)
+    picked = calibrated[np.arange(len(labels)), labels]
+    return float(-np.log(np.clip(picked, 1e-12, None)).mean())
+
+
+def fit_temperature(probabilities, labels, low=0.05, high=20.0, iterations=60):
+    """Temperature minimising the negative log-likelihood of ``labels``.
+
+    Golden-section search in log space; the NLL is unimodal in T.
+    """
+    labels = np.asarray(labels)
+    a, b = math.log(low), math.log(high)
+    ratio = (math.sqrt(5) - 1) / 2
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    fc, fd = negative_log_likelihood(probabilities, labels, math.exp(c)), negative_log_likelihood(probabilities, labels, math.exp(d))
+    for _ in range(iterations):
+        if fc < fd:
+            b, d, fd = d, c, fc
+            c = b - ratio * (b - a)
+            fc = negative_log_likelihood(probabilities, labels, math.exp(c))
+        else:
+            a, c, fc = c, d, fd
+            d = a + ratio * (b - a)
+            fd = negative_log_likelihood(probabilities, labels, math.exp(d))
+    return math.exp((a + b) / 2)
+
+
+def load_temperature(path=None, model_version=None):
+    """Fitted temperature from the calibration file, or 1.0 (no change) if there is none.
+
+    With ``model_version``, a file fitted on a different model is ignored too.
+    """
+    path = path or config.CALIBRATION_PATH
+    if not os.path.exists(path):
+        return 1.0
+    with open(path) as f:
+        calibration = json.load(f)
+    if model_version and calibration.get("model_version") not in (None, model_version):
+        return 1.0
+    return float(calibration["temperature"])
+
+
+# --------------------------------------------------
+# Batched post-processing
+# --------------------------------------------------
+def is_unknown(indices, scores, threshold=None):
+    """Rows whose best class is "non insects" or whose confidence is under ``threshold``.
+
+    Takes the ``(batch, k)`` arrays from :func:`top_k`.
+    """
+    threshold = config.UNKNOWN_THRESHOLD if threshold is None else threshold
+    indices, scores = np.asarray(indices), np.asarray(scores)
+    return (indices[:, 0] == NON_INSECT_INDEX) | (scores[:, 0] < threshold)
+
+
+def postprocess(probabilities, k=3, temperature=1.0, threshold=None):
+    """Calibrate, rank and flag a whole batch in one pass.
+
+    Returns ``(indices, scores, unknown)``; the first two are ``(batch, k)``
+    best first, ``unknown`` is a boolean ``(batch,)`` mask.
+    """
+    idx, scores = top_k(calibrate(probabilities, temperature), k)
+    return idx, scores, is_unknown(idx, scores, threshold)
@@ -0,0 +1,57 @@
+import numpy as np
+from PIL import Image, ImageOps
+
+from insectifica import config, metrics
+
+# Longest side of the copy kept for on-screen previews.
+PREVIEW_SIZE = (1024, 1024)
+
+_SCALE = np.float32(1 / 127.5)
+
+
+def open_image(source, max_size=None):
+    """Decode an upload at the smallest size that still serves the model and preview.
+
+    JPEGs are decoded in draft mode, so libjpeg scales by 1/2, 1/4 or 1/8
+    inside the DCT instead of materialising every pixel of a 48 MP photo.
+    EXIF orientation is applied, and if ``max_size`` is given the result is
+    downscaled to fit it.
+    """
+    with metrics.stage("decode"):
+        image = Image.open(source)
+        image.draft("RGB", max_size or config.IMAGE_SIZE)
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        if max_size:
+            image.thumbnail(max_size, reducing_gap=3.0)
+    return image
+
+
+def prepare_image(image):
+    """Resize a PIL image to the model input size as a uint8 HxWx3 array."""
+    with metrics.stage("resize"):
+        return np.asarray(image.convert("RGB").resize(config.IMAGE_SIZE, reducing_gap=3.0))
+
+
+def load_image(source):
+    """Decode a path or file-like object straight to model-sized pixels."""
+    with open_image(source) as image:
+        return prepare_image(image)
+
+
+def preprocess_input(x, out=None):
+    """NumPy equivalent of ``mobilenet_v2.preprocess_input``: scale pixels to [-1, 1].
+
+    Pass ``out`` (a float32 array, e.g. one row of a batch) to write in place.
+    """
+    with metrics.stage("preprocess"):
+        x = np.asarray(x)
+        if out is None:
+            out = np.empty(x.shape, dtype=np.float32)
+        np.multiply(x, _SCALE, out=out, casting="unsafe")
+        out -= 1.0
+    return out
+
+
+def to_model_input(image, out=None):
+    """Resize and normalise ``image`` in one pass into ``out``."""
+    return preprocess_input(prepare_image(image), out=out)
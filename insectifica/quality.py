@@ -0,0 +1,216 @@
+"""Photo quality gate run before the model.
+
+    python -m insectifica.quality --data data/val
+
+Blurry, dark, washed-out and empty photos end up as "non insects" or a
+low-confidence guess anyway, so they are caught first on a 256 px copy,
+which costs a few milliseconds instead of a forward pass:
+
+    sharpness    variance of the Laplacian, in the sharpest tile of a 4x4 grid
+                 so an insect in focus against a blurred background passes
+    exposure     share of near-black and of clipped pixels in the histogram of
+                 each pixel's brightest channel
+    foreground   share of pixels whose (lightly blurred) colour stands out from
+                 the image's mean colour, i.e. frequency-tuned saliency
+
+Exposure is checked first, then foreground, then sharpness, and a photo is
+rejected for the first check it fails: a dark frame also looks blurry and
+empty, but more light is what fixes it.
+
+Each issue maps to one of the photo tips shown on the identification page.
+The CLI runs the gate and the model over a labelled folder and reports how
+much inference time the gate saves and which identifications it costs.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from insectifica import config, metrics
+
+# Longest side of the grayscale copy the checks run on.
+ANALYSIS_SIZE = 256
+
+# Pixel levels (0-255) counted as near-black / clipped in the histogram.
+DARK_LEVEL = 32
+CLIPPED_LEVEL = 250
+
+# (icon, tip, message) per issue, matching the tips on the identification page.
+FEEDBACK = {
+    "blurry": ("📸", "Clear & Focused",
+               "The photo is too blurry. Get close and tap the insect to focus before taking the picture."),
+    "dark": ("☀️", "Natural Light",
+             "The photo is too dark. Take it in daylight and keep your shadow off the insect."),
+    "overexposed": ("☀️", "Natural Light",
+                    "The photo is washed out. Avoid the flash and direct sun glare."),
+    "no_subject": ("👐", "Plain Background",
+                   "Nothing stands out in this photo. Fill the frame with the insect on a leaf, wall or hand."),
+}
+
+
+def thresholds():
+    """Current thresholds, read from config so tests and the CLI can override them."""
+    return {
+        "min_sharpness": config.QUALITY_MIN_SHARPNESS,
+        "max_dark": config.QUALITY_MAX_DARK,
+        "max_clipped": config.QUALITY_MAX_CLIPPED,
+        "min_foreground": config.QUALITY_MIN_FOREGROUND,
+    }
+
+
+def _analysis_pixels(image):
+    scale = ANALYSIS_SIZE / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, reducing_gap=2.0)
+    return np.asarray(image.convert("RGB"), dtype=np.float32)
+
+
+def _box_blur(x):
+    """3x3 mean of an HxWxC array (edges trimmed)."""
+    rows = x[:-2] + x[1:-1] + x[2:]
+    return (rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]) / 9
+
+
+def measure(image, grid=4):
+    """Sharpness, exposure and foreground statistics of a PIL image."""
+    rgb = _analysis_pixels(image)
+    gray = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    laplacian = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+                 - 4 * gray[1:-1, 1:-1])
+    h, w = (laplacian.shape[0] // grid) * grid, (laplacian.shape[1] // grid) * grid
+    if h and w:
+        tiles = laplacian[:h, :w].reshape(grid, h // grid, grid, w // grid)
+        sharpness = float(tiles.var(axis=(1, 3)).max())
+    else:
+        sharpness = float(laplacian.var()) if laplacian.size else 0.0
+
+    histogram = np.bincount(rgb.max(axis=-1).astype(np.uint8).ravel(), minlength=256)
+    total = histogram.sum()
+
+    if min(rgb.shape[:2]) > 2:
+        distance = np.linalg.norm(_box_blur(rgb) - rgb.reshape(-1, 3).mean(axis=0), axis=-1)
+        # Adaptive cut as in frequency-tuned saliency, with a floor so sensor
+        # noise on a blank surface doesn't count as a subject.
+        foreground = float((distance > max(2 * distance.mean(), 24.0)).mean())
+    else:
+        foreground = 0.0
+
+    return {
+        "sharpness": round(sharpness, 1),
+        "dark": round(float(histogram[:DARK_LEVEL].sum() / total), 3),
+        "clipped": round(float(histogram[CLIPPED_LEVEL:].sum() / total), 3),
+        "brightness": round(float(gray.mean() / 255), 3),
+        "foreground": round(foreground, 3),
+    }
+
+
+def issue(stats, limits=None):
+    """The key of ``FEEDBACK`` for the statistics ``measure`` returned, or None."""
+    limits = limits or thresholds()
+    if stats["dark"] > limits["max_dark"]:
+        return "dark"
+    if stats["clipped"] > limits["max_clipped"]:
+        return "overexposed"
+    if stats["foreground"] < limits["min_foreground"]:
+        return "no_subject"
+    if stats["sharpness"] < limits["min_sharpness"]:
+        return "blurry"
+    return None
+
+
+def check(image, limits=None):
+    """Why ``image`` isn't worth classifying, or None when it is usable."""
+    with metrics.stage("quality"):
+        found = issue(measure(image), limits)
+    if found:
+        metrics.record_rejection(f"quality_{found}")
+    return found
+
+
+# --------------------------------------------------
+# Savings report
+# --------------------------------------------------
+def report(root, model_path, batch_size=32, limits=None):
+    """Gate and classify every image under ``root``; see ``main``."""
+    from insectifica.inference import TFLiteRunner, model_version
+    from insectifica.postprocess import NON_INSECT_INDEX, calibrate, is_unknown, load_temperature, top_k
+    from insectifica.preprocessing import PREVIEW_SIZE, open_image, preprocess_input, prepare_image
+    from insectifica.quantize import iter_labelled
+
+    samples = list(iter_labelled(root))
+    if not samples:
+        raise SystemExit(f"no labelled images under {root}")
+    limits = limits or thresholds()
+    runner = TFLiteRunner(model_path, num_threads=os.cpu_count())
+
+    found, gate_seconds, model_seconds, predictions = [], 0.0, 0.0, []
+    for start in range(0, len(samples), batch_size):
+        chunk = samples[start:start + batch_size]
+        pixels = []
+        for path, _ in chunk:
+            # The app gates its 1024 px preview, so time the gate on the same input.
+            with open_image(path, PREVIEW_SIZE) as image:
+                began = time.perf_counter()
+                found.append(issue(measure(image), limits))
+                gate_seconds += time.perf_counter() - began
+                # A rejected photo also skips the resize and normalisation.
+                began = time.perf_counter()
+                pixels.append(prepare_image(image))
+                model_seconds += time.perf_counter() - began
+        began = time.perf_counter()
+        predictions.append(runner.predict(preprocess_input(np.stack(pixels))))
+        model_seconds += time.perf_counter() - began
+
+    temperature = load_temperature(config.CALIBRATION_PATH, model_version(model_path))
+    probabilities = calibrate(np.concatenate(predictions), temperature)
+    idx, scores = top_k(probabilities, 1)
+    labels = np.array([label for _, label in samples])
+    rejected = np.array([f is not None for f in found])
+    # What the model would have made of the rejected photos.
+    correct = (idx[:, 0] == labels) & ~is_unknown(idx, scores)
+    non_insect = labels == NON_INSECT_INDEX
+    model_ms = model_seconds / len(samples) * 1000
+    gate_ms = gate_seconds / len(samples) * 1000
+    saved_ms = rejected.sum() * model_ms - len(samples) * gate_ms
+
+    by_issue = {}
+    for name in filter(None, found):
+        by_issue[name] = by_issue.get(name, 0) + 1
+    return {
+        "samples": len(samples),
+        "rejected": int(rejected.sum()),
+        "rejected_share": round(float(rejected.mean()), 3),
+        "by_issue": by_issue,
+        "gate_ms_per_image": round(gate_ms, 2),
+        "model_ms_per_image": round(model_ms, 2),
+        "inference_saved_share": round(float(saved_ms / (len(samples) * model_ms)), 3),
+        # Rejections the model would have identified correctly and confidently.
+        "lost_identifications": int((rejected & correct & ~non_insect).sum()),
+        "rejected_non_insects": int((rejected & non_insect).sum()),
+        "rejected_misidentified_or_unknown": int((rejected & ~correct & ~non_insect).sum()),
+        "thresholds": limits,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.quality",
+                                     description="Report what the photo quality gate saves on labelled images.")
+    parser.add_argument("--data", required=True, help="labelled image folder")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--min-sharpness", type=float, default=config.QUALITY_MIN_SHARPNESS)
+    parser.add_argument("--max-dark", type=float, default=config.QUALITY_MAX_DARK)
+    parser.add_argument("--max-clipped", type=float, default=config.QUALITY_MAX_CLIPPED)
+    parser.add_argument("--min-foreground", type=float, default=config.QUALITY_MIN_FOREGROUND)
+    args = parser.parse_args(argv)
+
+    limits = {"min_sharpness": args.min_sharpness, "max_dark": args.max_dark,
+              "max_clipped": args.max_clipped, "min_foreground": args.min_foreground}
+    print(json.dumps(report(args.data, args.model, limits=limits), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Build quantized variants of the classifier.
+
+    python -m insectifica.quantize --source exported_model/ \
+        --representative data/val --variants dynamic float16 int8
+
+A .tflite flatbuffer can't be re-quantized, so ``--source`` is the Keras
+model or SavedModel directory that mobilenetv2_insect.tflite was exported
+from. Each variant is written next to the original as
+``mobilenetv2_insect.<variant>.tflite`` and picked up by the app through
+INSECTIFICA_MODEL_VARIANT.
+
+The representative set for full-integer quantization is a labelled folder
+with one sub-directory per class name, the same layout
+benchmarks/models.py uses for accuracy.
+"""
+import argparse
+import itertools
+import os
+import random
+
+from insectifica import config
+from insectifica.batch import find_images
+from insectifica.preprocessing import load_image, preprocess_input
+from insectifica.species import class_names
+
+
+def iter_labelled(root):
+    """``(path, class_index)`` for every image under ``root/<class name>/``."""
+    lookup = {name.lower(): idx for idx, name in enumerate(class_names)}
+    for entry in sorted(os.listdir(root)):
+        idx = lookup.get(entry.lower())
+        folder = os.path.join(root, entry)
+        if idx is None or not os.path.isdir(folder):
+            continue
+        for path in find_images(folder):
+            yield path, idx
+
+
+def representative_dataset(root, num_samples=300, seed=0):
+    """Callable in the form TFLiteConverter.representative_dataset expects."""
+    paths = [path for path, _ in iter_labelled(root)]
+    random.Random(seed).shuffle(paths)
+
+    def generate():
+        for path in itertools.islice(paths, num_samples):
+            yield [preprocess_input(load_image(path))[None]]
+
+    if not paths:
+        raise ValueError(f"no labelled images under {root}")
+    return generate
+
+
+def _converter(source):
+    import tensorflow as tf
+
+    if os.path.isdir(source):
+        return tf.lite.TFLiteConverter.from_saved_model(source)
+    return tf.lite.TFLiteConverter.from_keras_model(tf.keras.models.load_model(source))
+
+
+def convert(source, variant, representative=None, num_samples=300):
+    """Return the flatbuffer bytes for one variant."""
+    import tensorflow as tf
+
+    converter = _converter(source)
+    if variant == "float32":
+        return converter.convert()
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if representative is None:
+            raise ValueError("int8 quantization needs a representative image folder")
+        converter.representative_dataset = representative_dataset(representative, num_samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    elif variant != "dynamic":
+        raise ValueError(f"unknown variant: {variant}")
+    return converter.convert()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.quantize",
+                                     description="Build quantized model variants.")
+    parser.add_argument("--source", required=True, help="Keras model file or SavedModel directory")
+    parser.add_argument("--variants", nargs="+", default=["dynamic", "float16", "int8"],
+                        choices=config.MODEL_VARIANTS)
+    parser.add_argument("--representative", help="labelled image folder (needed for int8)")
+    parser.add_argument("--num-samples", type=int, default=300)
+    parser.add_argument("--out-dir", default=".")
+    args = parser.parse_args(argv)
+
+    for variant in args.variants:
+        data = convert(args.source, variant, args.representative, args.num_samples)
+        path = os.path.join(args.out_dir, config.variant_path(variant))
+        with open(path, "wb") as f:
+            f.write(data)
+        print(f"{variant}: {path} ({len(data) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""Versioned models with hot swap and candidate traffic.
+
+    python -m insectifica.registry add mobilenetv2_insect.tflite --version 2026-10-01
+    python -m insectifica.registry activate 2026-10-01
+    python -m insectifica.registry candidate 2026-11-02 --percent 10 [--shadow]
+    python -m insectifica.registry promote
+    python -m insectifica.registry list
+
+The registry is a directory (INSECTIFICA_MODEL_REGISTRY) with one
+sub-directory per version and a routing file:
+
+    models/routing.json                {"active": ..., "candidate": ..., "candidate_percent": ..., "mode": ...}
+    models/<version>/model.tflite
+    models/<version>/manifest.json     checksum, class_names, knowledge_base_version, temperature
+
+A manifest pairs the model with the class names of its output units, so a
+retrained model whose classes come out in a different order is remapped to
+the app's ``class_names`` rather than mislabelling every prediction. The
+temperature is fitted per version by ``python -m insectifica.calibrate
+--version``, so every version's scores are calibrated for that model.
+
+Running processes poll routing.json. A version that isn't loaded yet gets
+its interpreters created and warmed on the watcher thread, then the
+deployment is swapped with a single assignment; predictions already running
+finish on the version they started on, which is retired once they have.
+
+With a candidate, ``candidate_percent`` of sessions are routed to it
+("ab" mode), or the active model keeps answering every request and that
+share of requests is also run on the candidate in the background, to
+compare latency and top-1 agreement ("shadow" mode).
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from insectifica import config, metrics
+from insectifica.inference import InterpreterPool, model_version
+from insectifica.postprocess import load_temperature
+from insectifica.scheduler import BatchScheduler
+from insectifica.species import class_names, load_knowledge_base
+
+logger = logging.getLogger("insectifica.registry")
+
+ROUTING_FILE = "routing.json"
+MANIFEST_FILE = "manifest.json"
+MODES = ("ab", "shadow")
+
+
+# --------------------------------------------------
+# Registry files
+# --------------------------------------------------
+def _write_json(path, data):
+    # Written beside the target and renamed, so readers never see half a file.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def read_routing(root):
+    with open(os.path.join(root, ROUTING_FILE)) as f:
+        routing = json.load(f)
+    if not routing.get("active"):
+        raise ValueError(f"{ROUTING_FILE} names no active version")
+    if routing.get("mode", "ab") not in MODES:
+        raise ValueError(f"routing mode must be one of {', '.join(MODES)}")
+    return routing
+
+
+def read_manifest(root, version):
+    with open(os.path.join(root, version, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def write_calibration(root, version, calibration):
+    """Store a fitted temperature (and its report) in a version's manifest."""
+    manifest = read_manifest(root, version)
+    manifest.update(temperature=calibration["temperature"], calibration=calibration)
+    _write_json(os.path.join(root, version, MANIFEST_FILE), manifest)
+
+
+def versions(root):
+    """Registered version names, oldest first."""
+    found = []
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry, MANIFEST_FILE)
+        if os.path.exists(path):
+            found.append((os.path.getmtime(path), entry))
+    return [name for _, name in sorted(found)]
+
+
+# --------------------------------------------------
+# Loaded versions
+# --------------------------------------------------
+class LatencyStats:
+    """Request count and recent latency percentiles of one version."""
+
+    def __init__(self, window=1024):
+        self._lock = threading.Lock()
+        self._recent = collections.deque(maxlen=window)
+        self.requests = 0
+        self.images = 0
+        self.shadow_images = 0
+        self.shadow_agreeing = 0
+
+    def observe(self, seconds, images):
+        with self._lock:
+            self._recent.append(seconds)
+            self.requests += 1
+            self.images += images
+
+    def observe_shadow(self, agreeing, images):
+        with self._lock:
+            self.shadow_images += images
+            self.shadow_agreeing += agreeing
+
+    def summary(self):
+        with self._lock:
+            ms = np.array(self._recent) * 1000
+            summary = {"requests": self.requests, "images": self.images}
+            if self.shadow_images:
+                summary["shadow_images"] = self.shadow_images
+                summary["shadow_agreement"] = round(self.shadow_agreeing / self.shadow_images, 3)
+        if len(ms):
+            summary.update(mean_ms=round(float(ms.mean()), 1),
+                           p50_ms=round(float(np.percentile(ms, 50)), 1),
+                           p95_ms=round(float(np.percentile(ms, 95)), 1))
+        return summary
+
+
+class ModelVersion:
+    """One model with its own interpreter pool and batch scheduler.
+
+    ``predict`` returns probabilities in the order of ``class_names``,
+    whatever order the model's own output units are in; ``temperature``
+    calibrates them.
+    """
+
+    def __init__(self, version, model_path, names=None, knowledge_base_version=None,
+                 pool_size=None, num_threads=None, temperature=1.0):
+        names = list(names or class_names)
+        unknown = [name for name in names if name not in class_names]
+        if unknown:
+            raise ValueError(f"model {version} has class(es) the app doesn't know: {', '.join(unknown)}")
+        self.version = version
+        self.model_path = model_path
+        self.knowledge_base_version = knowledge_base_version
+        self.temperature = float(temperature)
+        # Output unit i of this model is class_names[columns[i]]; None when identical.
+        self._columns = None if names == class_names else np.array([class_names.index(n) for n in names])
+        self.pool = InterpreterPool(model_path, size=pool_size, num_threads=num_threads)
+        self.scheduler = BatchScheduler(
+            self._forward,
+            max_batch_size=config.BATCH_MAX_SIZE,
+            max_wait_ms=config.BATCH_MAX_WAIT_MS,
+            workers=self.pool.size,
+            buckets=config.BATCH_BUCKETS,
+        )
+        self.stats = LatencyStats()
+        self._inflight = 0
+        self._retired = False
+        self._idle = threading.Condition()
+
+    @classmethod
+    def from_registry(cls, root, version, **kwargs):
+        manifest = read_manifest(root, version)
+        path = os.path.join(root, version, manifest.get("model", "model.tflite"))
+        checksum = model_version(path)
+        if manifest.get("checksum") and checksum != manifest["checksum"]:
+            raise ValueError(f"model {version}: {path} does not match its manifest")
+        # Not calibrated yet: the global calibration file, if it was fitted on this model.
+        temperature = manifest.get("temperature") or load_temperature(model_version=checksum)
+        kb_version = manifest.get("knowledge_base_version")
+        if kb_version and kb_version != load_knowledge_base().version:
+            logger.warning("model %s was registered against knowledge base %s, serving %s",
+                           version, kb_version, load_knowledge_base().version)
+        return cls(version, path, manifest.get("class_names"), kb_version, temperature=temperature, **kwargs)
+
+    def _forward(self, batch):
+        probabilities = self.pool.predict(batch)
+        if self._columns is None:
+            return probabilities
+        out = np.zeros((len(probabilities), len(class_names)), dtype=probabilities.dtype)
+        out[:, self._columns] = probabilities
+        return out
+
+    def predict(self, batch, scheduled=True):
+        """Class probabilities for ``batch``; ``scheduled`` shares forward passes with other sessions."""
+        with self._idle:
+            self._inflight += 1
+            # A retired version's scheduler is closed; late callers run directly.
+            scheduled = scheduled and not self._retired
+        start = time.perf_counter()
+        try:
+            return self.scheduler.predict(batch) if scheduled else self._forward(batch)
+        finally:
+            seconds = time.perf_counter() - start
+            self.stats.observe(seconds, len(batch))
+            metrics.record_model_latency(self.version, seconds)
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def warm(self):
+        """Create and exercise every interpreter of the pool."""
+        self.pool.warm(self.pool.size, invoke=True)
+
+    def retire(self, timeout=60.0):
+        """Stop the scheduler once the predictions already running have finished."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._inflight == 0, timeout)
+            self._retired = True
+        self.scheduler.close()
+
+    def queue_depth(self):
+        return 0 if self._retired else self.scheduler.stats()["queue_depth"]
+
+
+class Deployment:
+    """What is served right now; replaced as a whole, never modified."""
+
+    def __init__(self, active, candidate=None, candidate_percent=0.0, mode="ab"):
+        self.active = active
+        self.candidate = candidate
+        self.candidate_percent = candidate_percent if candidate is not None else 0.0
+        self.mode = mode
+
+    def versions(self):
+        return [v for v in (self.active, self.candidate) if v is not None]
+
+
+# --------------------------------------------------
+# Registry
+# --------------------------------------------------
+class ModelRegistry:
+    """Serves the deployment described by a registry directory.
+
+    ``route(key)`` picks the version for a session, ``predict`` runs a batch
+    on it (and on the shadow candidate, if any), ``watch()`` starts the
+    thread that applies routing changes.
+    """
+
+    def __init__(self, root=None, pool_size=None, num_threads=None, deployment=None):
+        self.root = root
+        self.pool_size = pool_size
+        self.num_threads = num_threads
+        self._routing_mtime = None
+        self._reload_lock = threading.Lock()
+        self._shadow = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="insectifica-shadow")
+        self._shadow_busy = threading.Semaphore(1)
+        self._deployment = deployment or self._load_deployment({})
+
+    @classmethod
+    def single(cls, model_path, pool_size=None, num_threads=None):
+        """A registry serving one model file, versioned by its content hash."""
+        checksum = model_version(model_path)
+        version = ModelVersion(checksum, model_path, pool_size=pool_size, num_threads=num_threads,
+                               temperature=load_temperature(model_version=checksum))
+        return cls(pool_size=pool_size, num_threads=num_threads, deployment=Deployment(version))
+
+    @property
+    def deployment(self):
+        return self._deployment
+
+    @property
+    def active(self):
+        return self._deployment.active
+
+    # ---------------- serving ----------------
+    def route(self, key=""):
+        """The version that serves ``key`` (e.g. a session id); stable for a given deployment."""
+        deployment = self._deployment
+        if deployment.mode == "ab" and deployment.candidate is not None:
+            bucket = int.from_bytes(hashlib.sha256(str(key).encode()).digest()[:4], "big") % 10000
+            if bucket < deployment.candidate_percent * 100:
+                return deployment.candidate
+        return deployment.active
+
+    def predict(self, batch, served=None, scheduled=True):
+        served = served or self.route()
+        probabilities = served.predict(batch, scheduled)
+        deployment = self._deployment
+        if (deployment.mode == "shadow" and deployment.candidate is not None and served is deployment.active
+                and random.random() * 100 < deployment.candidate_percent):
+            self._submit_shadow(deployment.candidate, np.array(batch), probabilities)
+        return probabilities
+
+    def _submit_shadow(self, candidate, batch, reference):
+        # At most one shadow pass at a time: when the candidate falls behind,
+        # batches are skipped rather than queued behind live traffic.
+        if not self._shadow_busy.acquire(blocking=False):
+            return
+        future = self._shadow.submit(self._run_shadow, candidate, batch, reference)
+        future.add_done_callback(lambda _: self._shadow_busy.release())
+
+    def _run_shadow(self, candidate, batch, reference):
+        try:
+            probabilities = candidate.predict(batch, scheduled=False)
+        except Exception:
+            logger.exception("shadow prediction on model %s failed", candidate.version)
+            return
+        agreeing = int((probabilities.argmax(axis=1) == reference.argmax(axis=1)).sum())
+        candidate.stats.observe_shadow(agreeing, len(batch))
+        metrics.record_shadow(candidate.version, agreeing, len(batch))
+
+    def stats(self):
+        """Latency and traffic of every version currently deployed."""
+        deployment = self._deployment
+        rows = []
+        for version in deployment.versions():
+            role = "active" if version is deployment.active else f"candidate ({deployment.mode})"
+            if version is deployment.candidate:
+                share = deployment.candidate_percent
+            else:
+                share = 100.0 - (deployment.candidate_percent if deployment.mode == "ab" else 0.0)
+            rows.append({"version": version.version, "role": role, "traffic_percent": share,
+                         "temperature": version.temperature,
+                         **version.stats.summary()})
+        return rows
+
+    def queue_depth(self):
+        return sum(v.queue_depth() for v in self._deployment.versions())
+
+    # ---------------- hot swap ----------------
+    def _load_deployment(self, loaded, warm=False):
+        routing = read_routing(self.root)
+
+        def load(name):
+            if name in loaded:
+                return loaded[name]
+            version = ModelVersion.from_registry(self.root, name, pool_size=self.pool_size,
+                                                 num_threads=self.num_threads)
+            if warm:
+                start = time.perf_counter()
+                version.warm()
+                logger.info("model %s loaded and warmed in %.1fs", name, time.perf_counter() - start)
+            return version
+
+        active = load(routing["active"])
+        candidate = load(routing["candidate"]) if routing.get("candidate") else None
+        return Deployment(active, candidate, float(routing.get("candidate_percent", 0)),
+                          routing.get("mode", "ab"))
+
+    def reload(self):
+        """Apply routing.json and return the new deployment.
+
+        New versions are warmed before the swap, so no request waits for them.
+        """
+        with self._reload_lock:
+            old = self._deployment
+            new = self._load_deployment({v.version: v for v in old.versions()}, warm=True)
+            self._deployment = new
+            for version in old.versions():
+                if all(version is not v for v in new.versions()):
+                    threading.Thread(target=version.retire, name="insectifica-retire", daemon=True).start()
+        logger.info("serving model %s%s", new.active.version,
+                    f", candidate {new.candidate.version} ({new.mode}, {new.candidate_percent:g}%)"
+                    if new.candidate else "")
+        return new
+
+    def _poll(self, interval):
+        path = os.path.join(self.root, ROUTING_FILE)
+        while True:
+            time.sleep(interval)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime == self._routing_mtime:
+                continue
+            # Noted first, so a broken file is reported once rather than on every poll.
+            self._routing_mtime = mtime
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("could not apply %s; still serving model %s", path, self.active.version)
+
+    def watch(self, interval=None):
+        """Poll routing.json on a daemon thread and hot-swap when it changes."""
+        self._routing_mtime = os.stat(os.path.join(self.root, ROUTING_FILE)).st_mtime_ns
+        thread = threading.Thread(target=self._poll, args=(interval or config.MODEL_REGISTRY_POLL,),
+                                  name="insectifica-registry", daemon=True)
+        thread.start()
+        return thread
+
+
+def temperature_for(model_path, root=None):
+    """Temperature of the model file at ``model_path``, for callers outside a registry.
+
+    Taken from the manifest of the registered version with the same checksum,
+    else from the calibration file if it was fitted on this model, else 1.0.
+    """
+    checksum = model_version(model_path)
+    root = root or config.MODEL_REGISTRY
+    if root and os.path.isdir(root):
+        for name in reversed(versions(root)):
+            manifest = read_manifest(root, name)
+            if manifest.get("checksum") == checksum and manifest.get("temperature"):
+                return float(manifest["temperature"])
+    return load_temperature(model_version=checksum)
+
+
+def load_registry(pool_size=None, num_threads=None):
+    """The configured registry, or the single MODEL_PATH model when there is none."""
+    if not config.MODEL_REGISTRY:
+        return ModelRegistry.single(config.MODEL_PATH, pool_size, num_threads)
+    registry = ModelRegistry(config.MODEL_REGISTRY, pool_size, num_threads)
+    registry.watch()
+    return registry
+
+
+# --------------------------------------------------
+# Command line
+# --------------------------------------------------
+def add(root, model, version, names=None):
+    target = os.path.join(root, version)
+    if os.path.exists(target):
+        raise SystemExit(f"version {version} already exists")
+    os.makedirs(target)
+    shutil.copyfile(model, os.path.join(target, "model.tflite"))
+    _write_json(os.path.join(target, MANIFEST_FILE), {
+        "version": version,
+        "model": "model.tflite",
+        "checksum": model_version(os.path.join(target, "model.tflite")),
+        "class_names": list(names or class_names),
+        "knowledge_base_version": load_knowledge_base().version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.registry",
+                                     description="Manage versioned models and their traffic.")
+    parser.add_argument("--root", default=config.MODEL_REGISTRY or "models", help="registry directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add_cmd = sub.add_parser("add", help="register a .tflite file as a new version")
+    add_cmd.add_argument("model")
+    add_cmd.add_argument("--version", required=True)
+    add_cmd.add_argument("--class-names", help="JSON list of the model's output classes, in order "
+                                               "(default: the app's class_names)")
+    activate = sub.add_parser("activate", help="serve a version to all traffic")
+    activate.add_argument("version")
+    candidate = sub.add_parser("candidate", help="send part of the traffic to another version")
+    candidate.add_argument("version", nargs="?")
+    candidate.add_argument("--percent", type=float, default=10.0)
+    candidate.add_argument("--shadow", action="store_true",
+                           help="run it on --percent of requests alongside the active model "
+                                "instead of answering with it")
+    candidate.add_argument("--clear", action="store_true", help="stop sending traffic to the candidate")
+    sub.add_parser("promote", help="make the candidate the active version")
+    sub.add_parser("list", help="show versions and routing")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.root, exist_ok=True)
+    routing_path = os.path.join(args.root, ROUTING_FILE)
+    routing = read_routing(args.root) if os.path.exists(routing_path) else {}
+    known = versions(args.root)
+
+    if args.command == "add":
+        names = None
+        if args.class_names:
+            with open(args.class_names) as f:
+                names = json.load(f)
+        add(args.root, args.model, args.version, names)
+        print(f"added {args.version}")
+        return
+    if args.command == "list":
+        for name in known:
+            manifest = read_manifest(args.root, name)
+            role = ("active" if name == routing.get("active") else
+                    f"candidate {routing.get('candidate_percent', 0):g}% {routing.get('mode', 'ab')}"
+                    if name == routing.get("candidate") else "")
+            print(f"{name}\t{manifest.get('created', '')}\tT={manifest.get('temperature', '-')}\t{role}")
+        return
+
+    if args.command == "activate":
+        if args.version not in known:
+            parser.error(f"unknown version {args.version}")
+        routing = {**routing, "active": args.version}
+        if routing.get("candidate") == args.version:
+            routing.pop("candidate")
+    elif args.command == "candidate":
+        if args.clear:
+            if not routing.get("candidate"):
+                print("there is no candidate")
+                return
+            routing.pop("candidate")
+        elif args.version not in known:
+            parser.error(f"unknown version {args.version}")
+        elif not routing:
+            parser.error("activate a version first")
+        else:
+            routing.update(candidate=args.version, candidate_percent=args.percent,
+                           mode="shadow" if args.shadow else "ab")
+    elif args.command == "promote":
+        if not routing.get("candidate"):
+            parser.error("there is no candidate")
+        routing = {"active": routing["candidate"]}
+    _write_json(routing_path, routing)
+    print(json.dumps(routing))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Daily identification counts, maintained as history is written.
+
+    python -m insectifica.rollups rebuild
+
+Each batch the history writer commits also bumps per-day counters by
+species, by Order and Family, and by host crop from the knowledge base, in
+the same transaction. Dashboards read these small tables, whose size
+depends on days and species rather than on the number of identifications.
+``rebuild`` recomputes them from the full history, e.g. after the species
+data changes.
+"""
+import argparse
+import collections
+import time
+
+from insectifica import config
+from insectifica.species import NON_INSECT, split_values
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollup_species_day (
+    day TEXT NOT NULL,
+    species TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    unknown INTEGER NOT NULL,
+    PRIMARY KEY (day, species)
+);
+CREATE TABLE IF NOT EXISTS rollup_taxon_day (
+    day TEXT NOT NULL,
+    rank TEXT NOT NULL,
+    taxon TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, rank, taxon)
+);
+CREATE TABLE IF NOT EXISTS rollup_crop_day (
+    day TEXT NOT NULL,
+    crop TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, crop)
+);
+"""
+
+RANKS = ("Order", "Family")
+
+
+def day_of(created):
+    return time.strftime("%Y-%m-%d", time.localtime(created))
+
+
+class Rollups:
+    """Rollup tables living in the history database.
+
+    Registers itself as a listener on ``store`` so every committed batch is
+    counted; only confident insect identifications feed the taxon and crop
+    tables, while the species table counts everything with its unknown share.
+    """
+
+    def __init__(self, store, knowledge_base):
+        self.store = store
+        # (taxa, crops) each species contributes, resolved once up front
+        self._tags = {name: self._resolve(knowledge_base, name) for name in knowledge_base.class_names}
+        conn = store.connection()
+        fresh = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'rollup_species_day'").fetchone() is None
+        with conn:
+            conn.executescript(SCHEMA)
+        store.add_listener(self.update)
+        if fresh:
+            # History recorded before rollups existed
+            self.rebuild()
+
+    @staticmethod
+    def _resolve(knowledge_base, species):
+        if species == NON_INSECT:
+            return [], []
+        record = knowledge_base.get(species)
+        taxa = [(rank, value) for rank in RANKS for value in split_values(rank, record.get(rank, ""))]
+        return taxa, split_values("Host Crops", record.get("Host Crops", ""))
+
+    def update(self, conn, rows):
+        """Add ``(created, species, unknown)`` rows to the counters inside the caller's transaction."""
+        species_counts = collections.Counter()
+        unknown_counts = collections.Counter()
+        taxon_counts = collections.Counter()
+        crop_counts = collections.Counter()
+        for created, species, unknown in rows:
+            day = day_of(created)
+            species_counts[day, species] += 1
+            if unknown:
+                unknown_counts[day, species] += 1
+                continue
+            taxa, crops = self._tags.get(species, ((), ()))
+            for rank, taxon in taxa:
+                taxon_counts[day, rank, taxon] += 1
+            for crop in crops:
+                crop_counts[day, crop] += 1
+
+        conn.executemany(
+            "INSERT INTO rollup_species_day (day, species, count, unknown) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (day, species) DO UPDATE SET"
+            " count = count + excluded.count, unknown = unknown + excluded.unknown",
+            [(*key, n, unknown_counts[key]) for key, n in species_counts.items()],
+        )
+        conn.executemany(
+            "INSERT INTO rollup_taxon_day (day, rank, taxon, count) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (day, rank, taxon) DO UPDATE SET count = count + excluded.count",
+            [(*key, n) for key, n in taxon_counts.items()],
+        )
+        conn.executemany(
+            "INSERT INTO rollup_crop_day (day, crop, count) VALUES (?, ?, ?)"
+            " ON CONFLICT (day, crop) DO UPDATE SET count = count + excluded.count",
+            [(*key, n) for key, n in crop_counts.items()],
+        )
+
+    def rebuild(self, chunk_size=5000):
+        """Recompute every rollup from the identifications table."""
+        self.store.flush()
+        conn = self.store.connection()
+        with conn:
+            conn.execute("DELETE FROM rollup_species_day")
+            conn.execute("DELETE FROM rollup_taxon_day")
+            conn.execute("DELETE FROM rollup_crop_day")
+            cursor = conn.execute("SELECT created, species, unknown FROM identifications ORDER BY id")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                self.update(conn, [tuple(row) for row in rows])
+
+    # ---------------- reading ----------------
+    def _since(self, days):
+        return day_of(time.time() - (days - 1) * 86400)
+
+    def species_by_day(self, days=30):
+        """``(day, species, count, unknown)`` rows for the last ``days`` days."""
+        return [tuple(row) for row in self.store.connection().execute(
+            "SELECT day, species, count, unknown FROM rollup_species_day WHERE day >= ?"
+            " ORDER BY day", (self._since(days),),
+        )]
+
+    def taxa(self, rank, days=30):
+        """``(taxon, count)`` totals for ``rank`` ("Order" or "Family"), largest first."""
+        return [tuple(row) for row in self.store.connection().execute(
+            "SELECT taxon, SUM(count) AS n FROM rollup_taxon_day WHERE rank = ? AND day >= ?"
+            " GROUP BY taxon ORDER BY n DESC", (rank, self._since(days)),
+        )]
+
+    def crops(self, days=30):
+        """``(crop, count)`` totals, largest first."""
+        return [tuple(row) for row in self.store.connection().execute(
+            "SELECT crop, SUM(count) AS n FROM rollup_crop_day WHERE day >= ?"
+            " GROUP BY crop ORDER BY n DESC", (self._since(days),),
+        )]
+
+
+def main(argv=None):
+    from insectifica.history import HistoryStore
+    from insectifica.species import load_knowledge_base
+
+    parser = argparse.ArgumentParser(prog="python -m insectifica.rollups",
+                                     description="Maintain the outbreak rollup tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="recompute every rollup from the identification history")
+    parser.add_argument("--db", default=config.HISTORY_DB)
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.db)
+    try:
+        start = time.perf_counter()
+        Rollups(store, load_knowledge_base()).rebuild()
+        print(f"rebuilt rollups for {store.count():,} identifications "
+              f"in {time.perf_counter() - start:.1f}s")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
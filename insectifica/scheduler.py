@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+from insectifica import metrics
+
+
+class BatchScheduler:
+    """Collect single images from many sessions into shared forward passes.
+
+    ``submit`` queues one preprocessed image and returns a Future for its
+    probability row. Worker threads (one per interpreter is a good default)
+    wait for the first request, keep collecting until ``max_batch_size``
+    images are queued or ``max_wait_ms`` has passed, run ``predict`` once
+    and fan the rows back out.
+
+    Each batch is zero-padded up to the next of ``buckets`` (powers of two
+    up to ``max_batch_size`` by default, so at most twice the rows): every
+    new batch size makes the interpreter reallocate its tensors and XNNPACK
+    re-prepare. ``benchmarks/buckets.py`` weighs that against the padded
+    compute for a given model; listing every size turns padding off.
+    """
+
+    def __init__(self, predict, max_batch_size=16, max_wait_ms=10.0, workers=1, max_queue=4096,
+                 buckets=None):
+        self._predict = predict
+        self.max_batch_size = max_batch_size
+        if buckets is None:
+            buckets = [2 ** i for i in range(max_batch_size.bit_length()) if 2 ** i < max_batch_size]
+        self.buckets = sorted({min(b, max_batch_size) for b in buckets} | {max_batch_size})
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_depths = Counter()
+        self._requests = 0
+        self._padded = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"insectifica-batcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # ---------------- client side ----------------
+    def submit(self, image):
+        if self._closed:
+            raise RuntimeError("scheduler is closed")
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def predict(self, batch, timeout=None):
+        """Drop-in for ``model.predict``: rows are scheduled individually."""
+        futures = [self.submit(image) for image in batch]
+        return np.stack([f.result(timeout=timeout) for f in futures])
+
+    def stats(self):
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": batches,
+                "mean_batch_size": self._requests / batches if batches else 0.0,
+                "padded_rows": self._padded,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_depth_histogram": dict(sorted(self._queue_depths.items())),
+            }
+
+    def close(self):
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    # ---------------- worker side ----------------
+    def _collect(self, first):
+        items = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: hand it back so this worker exits next.
+                self._queue.put(None)
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            depth = self._queue.qsize()
+            items = self._collect(first)
+            items = [(image, f) for image, f in items if f.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            size = next(b for b in self.buckets if b >= len(items))
+            with self._stats_lock:
+                self._batch_sizes[len(items)] += 1
+                self._queue_depths[depth] += 1
+                self._requests += len(items)
+                self._padded += size - len(items)
+            metrics.record_batch(len(items))
+            try:
+                batch = np.zeros((size, *items[0][0].shape), dtype=items[0][0].dtype)
+                for row, (image, _) in enumerate(items):
+                    batch[row] = image
+                output = self._predict(batch)
+            except Exception as exc:
+                for _, future in items:
+                    future.set_exception(exc)
+                continue
+            for row, (_, future) in zip(output, items):
+                future.set_result(row)
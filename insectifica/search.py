@@ -0,0 +1,119 @@
+import bisect
+import math
+import re
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "into", "is",
+    "it", "of", "on", "or", "the", "their", "to", "with",
+}
+
+# Which record fields feed each kind of query.
+QUERY_FIELDS = {
+    "crop": ("Host Crops",),
+    "taxon": ("Scientific Name", "Common Name", "Order", "Family", "Genus"),
+    "text": ("Damage Symptoms", "Common Name", "Host Crops", "IPM Measures"),
+}
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+class _Postings:
+    """Token -> sorted array of class indices, with prefix lookup over a sorted vocabulary."""
+
+    def __init__(self, size):
+        self.size = size
+        self.postings = {}
+        self.vocabulary = []
+
+    def add(self, idx, text):
+        for token in tokenize(text):
+            self.postings.setdefault(token, set()).add(idx)
+
+    def freeze(self):
+        self.postings = {t: np.fromiter(sorted(d), dtype=np.int32) for t, d in self.postings.items()}
+        self.vocabulary = sorted(self.postings)
+
+    def mask(self, token, prefix=False):
+        """Boolean mask over class indices for ``token`` (or every word it prefixes)."""
+        mask = np.zeros(self.size, dtype=bool)
+        if not prefix or len(token) < 2:
+            docs = self.postings.get(token)
+            if docs is not None:
+                mask[docs] = True
+            return mask
+        start = bisect.bisect_left(self.vocabulary, token)
+        for word in self.vocabulary[start:]:
+            if not word.startswith(token):
+                break
+            mask[self.postings[word]] = True
+        return mask
+
+
+class SpeciesIndex:
+    """Tokenized inverted index over the knowledge base, built once.
+
+    ``crop`` and ``taxon`` queries are filters (every token must match);
+    ``text`` is a ranked free-text query over symptoms and related fields,
+    where rarer matching tokens weigh more. The last token of each query is
+    matched as a prefix so results update while the user is still typing.
+    """
+
+    def __init__(self, knowledge_base):
+        self.knowledge_base = knowledge_base
+        self._size = len(knowledge_base)
+        self._fields = {kind: _Postings(self._size) for kind in QUERY_FIELDS}
+        for idx, record in enumerate(knowledge_base.records):
+            for kind, fields in QUERY_FIELDS.items():
+                for field in fields:
+                    self._fields[kind].add(idx, record.get(field, ""))
+        for postings in self._fields.values():
+            postings.freeze()
+
+    def _match_all(self, kind, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        postings = self._fields[kind]
+        result = np.ones(self._size, dtype=bool)
+        for i, token in enumerate(tokens):
+            result &= postings.mask(token, prefix=i == len(tokens) - 1)
+        return result
+
+    def _rank_text(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        postings = self._fields["text"]
+        scores = np.zeros(self._size, dtype=np.float32)
+        for i, token in enumerate(tokens):
+            mask = postings.mask(token, prefix=i == len(tokens) - 1)
+            hits = int(mask.sum())
+            if hits:
+                scores += np.float32(math.log(1 + self._size / hits)) * mask
+        return scores
+
+    def search(self, crop="", taxon="", text="", limit=50):
+        """Class indices matching every non-empty query, best first."""
+        candidates = None
+        for kind, query in (("crop", crop), ("taxon", taxon)):
+            matched = self._match_all(kind, query)
+            if matched is not None:
+                candidates = matched if candidates is None else candidates & matched
+
+        scores = self._rank_text(text)
+        if scores is None:
+            if candidates is None:
+                return []
+            return np.flatnonzero(candidates)[:limit].tolist()
+        if candidates is not None:
+            scores[~candidates] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > limit:
+            hits = hits[np.argpartition(-scores[hits], limit)[:limit]]
+        # Best score first, ties in class order.
+        return hits[np.lexsort((hits, -scores[hits]))].tolist()
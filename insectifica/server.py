@@ -0,0 +1,291 @@
+"""HTTP inference service sharing the app's model, preprocessing and species data.
+
+    python -m insectifica.server --port 8000
+
+    POST /v1/classify          one image (raw body or multipart field "file")
+    POST /v1/classify:batch    several images (multipart fields "files")
+    GET  /v1/species/{name}    knowledge-base record by scientific or common name
+
+Decoding and inference run in a process pool so the event loop only parses
+requests and serialises responses. Under ``insectifica.supervisor`` each
+pre-forked worker already is one such process, and runs them on a single
+thread next to its event loop instead (``inline=True``). For in-process
+testing:
+
+    from starlette.testclient import TestClient
+    with TestClient(create_app()) as client:
+        client.post("/v1/classify", content=open("bug.jpg", "rb").read())
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from insectifica import config, metrics
+from insectifica.cache import PredictionCache
+from insectifica.inference import TFLiteRunner, model_version
+from insectifica.postprocess import calibrate, is_unknown, top_k
+from insectifica.preprocessing import load_image, preprocess_input
+from insectifica.registry import temperature_for
+from insectifica.species import load_knowledge_base
+
+# Requests allowed to wait for a free inference slot before we answer 503.
+QUEUE_FACTOR = 4
+
+# Allowance for multipart boundaries and part headers on top of the image bytes.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+# --------------------------------------------------
+# Worker process side
+# --------------------------------------------------
+_runner = None
+
+
+def _init_worker(model_path, num_threads):
+    global _runner
+    _runner = TFLiteRunner(model_path, num_threads=num_threads)
+
+
+def _classify(blobs, k, temperature=1.0):
+    """Decode, batch and classify raw image bytes; runs inside a worker process.
+
+    Returns the results and ``(stage, seconds)`` timings, which the parent
+    records because this process's metrics are never scraped.
+    """
+    height, width = config.IMAGE_SIZE[1], config.IMAGE_SIZE[0]
+    batch = np.empty((len(blobs), height, width, 3), dtype=np.float32)
+    rows, results, timings = [], [None] * len(blobs), []
+    for i, data in enumerate(blobs):
+        start = time.perf_counter()
+        try:
+            pixels = load_image(io.BytesIO(data))
+        except Exception as exc:
+            results[i] = f"cannot decode image: {type(exc).__name__}"
+            continue
+        decoded = time.perf_counter()
+        preprocess_input(pixels, out=batch[len(rows)])
+        timings += [("decode", decoded - start), ("preprocess", time.perf_counter() - decoded)]
+        rows.append(i)
+    if rows:
+        start = time.perf_counter()
+        probabilities = _runner.predict(batch[: len(rows)])
+        timings.append(("predict", time.perf_counter() - start))
+        idx, scores = top_k(calibrate(probabilities, temperature), k)
+        for row, i in enumerate(rows):
+            results[i] = list(zip(idx[row].tolist(), scores[row].tolist()))
+    return results, timings
+
+
+# --------------------------------------------------
+# Request handling
+# --------------------------------------------------
+class HTTPError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+async def _limited_stream(request, limit):
+    # The body as it arrives, aborted with 413 once it passes ``limit`` bytes.
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > limit:
+        raise HTTPError(413, f"request is larger than {limit // (1024 * 1024)} MB")
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPError(413, f"request is larger than {limit // (1024 * 1024)} MB")
+        yield chunk
+
+
+async def _read_images(request, field, max_images=1):
+    limit = max_images * config.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        parser = MultiPartParser(request.headers, _limited_stream(request, limit), max_files=max_images)
+        try:
+            form = await parser.parse()
+        except MultiPartException as exc:
+            raise HTTPError(400, exc.message)
+        uploads = form.getlist(field) or form.getlist("file") or form.getlist("files")
+        blobs = [(u.filename, await u.read()) for u in uploads if hasattr(u, "read")]
+        await form.close()
+    else:
+        blobs = [(None, b"".join([chunk async for chunk in _limited_stream(request, limit)]))]
+    blobs = [(name, data) for name, data in blobs if data]
+    if not blobs:
+        raise HTTPError(400, "no image in request")
+    for name, data in blobs:
+        if len(data) > config.MAX_UPLOAD_BYTES:
+            raise HTTPError(413, f"{name or 'image'} is larger than 10 MB")
+    return blobs
+
+
+def _format(state, name, prediction):
+    if isinstance(prediction, str):
+        return {"file": name, "error": prediction}
+    kb = state.knowledge_base
+    (best, confidence), *_ = prediction
+    return {
+        "file": name,
+        "unknown": bool(is_unknown([[best]], [[confidence]])[0]),
+        "predictions": [
+            {
+                "species": kb.class_names[i],
+                "common_name": kb[i].get("Common Name"),
+                "confidence": round(score, 6),
+            }
+            for i, score in prediction
+        ],
+    }
+
+
+async def _predict(state, blobs, k):
+    keys = [state.cache.key(data, state.cache_version) for _, data in blobs]
+    results = [state.cache.get(key) for key in keys]
+    # A cached top-3 can answer top_k=1 but not top_k=5.
+    results = [r if r is not None and len(r) >= k else None for r in results]
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        if state.waiting >= state.max_waiting:
+            raise HTTPError(503, "inference queue is full, retry shortly")
+        state.waiting += 1
+        try:
+            async with state.slots:
+                loop = asyncio.get_running_loop()
+                # The cache is shared with the app, so it always gets at least TOP_K results.
+                fresh, timings = await loop.run_in_executor(
+                    state.executor, _classify, [blobs[i][1] for i in missing], max(k, config.TOP_K),
+                    state.temperature,
+                )
+        finally:
+            state.waiting -= 1
+        for name, seconds in timings:
+            metrics.observe_stage(name, seconds)
+        for i, prediction in zip(missing, fresh):
+            results[i] = prediction
+            if not isinstance(prediction, str):
+                state.cache.put(keys[i], prediction)
+    for prediction in results:
+        if isinstance(prediction, str):
+            metrics.record_rejection("undecodable")
+        else:
+            (best, confidence), *_ = prediction
+            metrics.record_prediction(state.knowledge_base.class_names[best], confidence)
+    return [_format(state, name, r if isinstance(r, str) else r[:k]) for (name, _), r in zip(blobs, results)]
+
+
+def _top_k_param(request):
+    try:
+        k = int(request.query_params.get("top_k", config.TOP_K))
+    except ValueError:
+        raise HTTPError(400, "top_k must be an integer")
+    return max(1, min(k, len(request.app.state.knowledge_base)))
+
+
+async def classify(request):
+    blobs = await _read_images(request, "file")
+    (result,) = await _predict(request.app.state, blobs[:1], _top_k_param(request))
+    status = 422 if "error" in result else 200
+    return JSONResponse({**result, "model_version": request.app.state.model_version}, status)
+
+
+async def classify_batch(request):
+    blobs = await _read_images(request, "files", config.SERVER_MAX_BATCH_IMAGES)
+    results = await _predict(request.app.state, blobs, _top_k_param(request))
+    return JSONResponse({"results": results, "model_version": request.app.state.model_version})
+
+
+async def species(request):
+    kb = request.app.state.knowledge_base
+    name = request.path_params["name"]
+    record = kb.get(name) or next(iter(kb.by_common_name(name)), None)
+    if record is None:
+        raise HTTPError(404, f"unknown species: {name}")
+    return JSONResponse(record)
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "model_version": request.app.state.model_version})
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def _http_error(request, exc):
+    return JSONResponse({"error": exc.detail}, exc.status)
+
+
+# --------------------------------------------------
+# Application
+# --------------------------------------------------
+def create_app(model_path=None, workers=None, max_concurrency=None, num_threads=None, inline=False):
+    model_path = model_path or config.MODEL_PATH
+    workers = workers or config.SERVER_WORKERS
+    max_concurrency = max_concurrency or config.SERVER_MAX_CONCURRENCY
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        state = app.state
+        state.knowledge_base = load_knowledge_base()
+        state.model_version = model_version(model_path)
+        state.temperature = temperature_for(model_path)
+        # Cached scores are calibrated, so the temperature is part of the key.
+        state.cache_version = f"{state.model_version}-T{state.temperature:g}"
+        state.cache = PredictionCache(config.CACHE_SIZE, db_path=config.CACHE_DB,
+                                      max_rows=config.CACHE_DB_MAX_ROWS, max_age_days=config.CACHE_DB_MAX_AGE_DAYS)
+        state.slots = asyncio.Semaphore(max_concurrency)
+        state.waiting = 0
+        state.max_waiting = max_concurrency * QUEUE_FACTOR
+        initargs = (model_path, num_threads or config.NUM_THREADS)
+        if inline:
+            state.executor = ThreadPoolExecutor(max_workers=1, initializer=_init_worker,
+                                                initargs=initargs)
+        else:
+            state.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                 initargs=initargs)
+        try:
+            yield
+        finally:
+            state.executor.shutdown(wait=True, cancel_futures=True)
+
+    routes = [
+        Route("/v1/classify", classify, methods=["POST"]),
+        Route("/v1/classify:batch", classify_batch, methods=["POST"]),
+        Route("/v1/species/{name}", species, methods=["GET"]),
+        Route("/healthz", health, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ]
+    return Starlette(routes=routes, lifespan=lifespan, exception_handlers={HTTPError: _http_error})
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(prog="python -m insectifica.server",
+                                     description="Serve the insect classifier over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS,
+                        help="inference processes")
+    parser.add_argument("--max-concurrency", type=int, default=config.SERVER_MAX_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    app = create_app(args.model, workers=args.workers, max_concurrency=args.max_concurrency)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
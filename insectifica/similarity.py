@@ -0,0 +1,274 @@
+"""Nearest reference specimens by image embedding.
+
+    python -m insectifica.similarity export-model --source exported_model/
+    python -m insectifica.similarity build --references data/reference --dtype int8
+
+``export-model`` cuts the classifier at its penultimate layer and writes
+``mobilenetv2_insect.embedding.tflite``; like ``insectifica.quantize`` it
+needs the Keras model or SavedModel the app's .tflite came from. ``build``
+embeds a labelled reference folder (one sub-folder per class name) and
+writes an inverted-file (IVF) index next to ``INSECTIFICA_REFERENCE_INDEX``:
+
+    references.vectors.npy   unit-length embeddings, float16 or int8, grouped by cell
+    references.paths.npy     UTF-8 image paths, concatenated
+    references.index.npz     cell centroids and offsets, labels, path offsets
+
+The vector and path files are memory-mapped, so loading the index costs
+only the centroids. A query scores the centroids, then only the vectors of
+the ``nprobe`` closest cells, which sit contiguously on disk.
+"""
+import argparse
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from insectifica import config
+from insectifica.preprocessing import load_image, preprocess_input
+
+INT8_SCALE = 127.0
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+# --------------------------------------------------
+# Index
+# --------------------------------------------------
+def kmeans(vectors, clusters, iterations=10, sample=None, seed=0):
+    """Spherical k-means centroids of unit-length ``vectors``.
+
+    Trained on at most ``sample`` rows (default 64 per cluster), which is
+    plenty to place the cells and keeps training time independent of the
+    collection size.
+    """
+    rng = np.random.default_rng(seed)
+    sample = min(len(vectors), sample or 64 * clusters)
+    rows = np.sort(rng.choice(len(vectors), sample, replace=False))
+    data = normalize(vectors[rows])
+    centroids = data[rng.choice(sample, clusters, replace=False)]
+    for _ in range(iterations):
+        assign = assign_cells(data, centroids)
+        counts = np.bincount(assign, minlength=clusters)
+        order = np.argsort(assign, kind="stable")
+        sums = np.zeros_like(centroids)
+        used = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[used]
+        sums[used] = np.add.reduceat(data[order], starts, axis=0)
+        empty = ~used
+        # Re-seed empty cells from random points so none stays unused.
+        sums[empty] = data[rng.choice(sample, int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def assign_cells(vectors, centroids, chunk=16384):
+    """Closest centroid (highest cosine) of every row."""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        out[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def encode(vectors, dtype):
+    vectors = normalize(vectors)
+    if dtype == "int8":
+        return np.round(vectors * INT8_SCALE).astype(np.int8)
+    return vectors.astype(np.float16)
+
+
+def write_index(prefix, vectors, labels, paths, dtype="float16", clusters=None, iterations=10,
+                chunk=16384):
+    """Cluster, reorder and save ``vectors``; returns the number of cells.
+
+    ``vectors`` may be a memory-mapped array; it is only read in chunks.
+    """
+    if clusters is None:
+        clusters = int(np.clip(4 * math.sqrt(len(vectors)), 1, 65536))
+    clusters = min(clusters, len(vectors))
+    centroids = kmeans(vectors, clusters, iterations)
+    # The argmax of a dot product doesn't depend on the row's length.
+    cells = assign_cells(vectors, centroids)
+    order = np.argsort(cells, kind="stable")
+    offsets = np.zeros(clusters + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cells, minlength=clusters), out=offsets[1:])
+
+    out = np.lib.format.open_memmap(prefix + ".vectors.npy", mode="w+", dtype=dtype,
+                                    shape=(len(vectors), vectors.shape[1]))
+    for start in range(0, len(order), chunk):
+        rows = order[start:start + chunk]
+        # Read the memory map in ascending order, then put the rows back in cell order.
+        ascending = np.sort(rows)
+        out[start:start + len(rows)] = encode(vectors[ascending][np.searchsorted(ascending, rows)], dtype)
+    out.flush()
+    del out
+    encoded = [paths[i].encode("utf-8") for i in order]
+    path_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in encoded], out=path_offsets[1:])
+    np.save(prefix + ".paths.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.savez(prefix + ".index.npz", centroids=centroids.astype(np.float32), offsets=offsets,
+             labels=np.asarray(labels, dtype=np.int16)[order], path_offsets=path_offsets)
+    return clusters
+
+
+class ReferenceIndex:
+    """IVF index over the reference embeddings written by ``write_index``."""
+
+    def __init__(self, prefix, nprobe=None):
+        meta = np.load(prefix + ".index.npz")
+        self.centroids = meta["centroids"]
+        self.offsets = meta["offsets"]
+        self.labels = meta["labels"]
+        self._path_offsets = meta["path_offsets"]
+        self.vectors = np.load(prefix + ".vectors.npy", mmap_mode="r")
+        self._paths = np.load(prefix + ".paths.npy", mmap_mode="r")
+        self.scale = INT8_SCALE if self.vectors.dtype == np.int8 else 1.0
+        self.nprobe = nprobe or config.REFERENCE_NPROBE
+        self._local = threading.local()
+
+    def _buffer(self, rows):
+        # float32 scratch for the candidate vectors, reused per thread to skip
+        # re-faulting tens of MB of fresh pages on every query.
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < rows:
+            buffer = self._local.buffer = np.empty((rows, self.vectors.shape[1]), dtype=np.float32)
+        return buffer[:rows]
+
+    @classmethod
+    def load(cls, prefix=None, nprobe=None):
+        """The index at ``prefix``, or None when it hasn't been built."""
+        prefix = prefix or config.REFERENCE_INDEX
+        if not os.path.exists(prefix + ".index.npz"):
+            return None
+        return cls(prefix, nprobe)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def path(self, row):
+        start, end = self._path_offsets[row], self._path_offsets[row + 1]
+        return bytes(self._paths[start:end]).decode("utf-8")
+
+    def search(self, query, k=5, nprobe=None):
+        """``(rows, scores)`` of the ``k`` most similar references, best first.
+
+        Scores are cosine similarities; rows index ``labels`` and ``path()``.
+        """
+        query = normalize(query).ravel()
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        cells = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        spans = [(self.offsets[c], self.offsets[c + 1]) for c in np.sort(cells)]
+        rows = np.concatenate([np.arange(start, end) for start, end in spans])
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # Widen each cell straight from the memory map into one float32 block.
+        candidates = self._buffer(len(rows))
+        pos = 0
+        for start, end in spans:
+            candidates[pos:pos + end - start] = self.vectors[start:end]
+            pos += end - start
+        scores = candidates @ query
+        scores /= self.scale
+        k = min(k, len(rows))
+        best = np.argpartition(scores, -k)[-k:]
+        best = best[np.argsort(-scores[best])]
+        return rows[best], scores[best]
+
+
+# --------------------------------------------------
+# Offline tools
+# --------------------------------------------------
+def export_model(source):
+    """Flatbuffer bytes of the classifier truncated before its output layer."""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(source)
+    embedding = tf.keras.Model(model.inputs, model.layers[-2].output)
+    return tf.lite.TFLiteConverter.from_keras_model(embedding).convert()
+
+
+def embed_folder(runner, paths, out, batch_size=32):
+    """Embed ``paths`` into the rows of ``out``; returns the paths kept, in row order.
+
+    Unreadable files are skipped, so only the first ``len(kept)`` rows are filled.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    height, width = config.IMAGE_SIZE[1], config.IMAGE_SIZE[0]
+    batch = np.empty((batch_size, height, width, 3), dtype=np.float32)
+    kept = []
+
+    def decode(path):
+        try:
+            return path, load_image(path)
+        except Exception:
+            return path, None
+
+    with ThreadPoolExecutor() as pool:
+        for start in range(0, len(paths), batch_size):
+            ok = []
+            for path, pixels in pool.map(decode, paths[start:start + batch_size]):
+                if pixels is not None:
+                    preprocess_input(pixels, out=batch[len(ok)])
+                    ok.append(path)
+            if ok:
+                out[len(kept):len(kept) + len(ok)] = runner.predict(batch[: len(ok)]).reshape(len(ok), -1)
+                kept.extend(ok)
+    return kept
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.similarity",
+                                     description="Build the reference-image similarity index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export-model", help="write the embedding .tflite")
+    export.add_argument("--source", required=True, help="Keras model file or SavedModel directory")
+    export.add_argument("--out", default=config.EMBEDDING_MODEL_PATH)
+    build = sub.add_parser("build", help="embed a labelled reference folder and index it")
+    build.add_argument("--references", required=True, help="folder with one sub-folder per class")
+    build.add_argument("--model", default=config.EMBEDDING_MODEL_PATH)
+    build.add_argument("--out", default=config.REFERENCE_INDEX, help="index file prefix")
+    build.add_argument("--dtype", choices=["float16", "int8"], default="float16")
+    build.add_argument("--clusters", type=int, default=None, help="IVF cells (default 4*sqrt(N))")
+    args = parser.parse_args(argv)
+
+    if args.command == "export-model":
+        data = export_model(args.source)
+        with open(args.out, "wb") as f:
+            f.write(data)
+        print(f"{args.out} ({len(data) / 1e6:.1f} MB)")
+        return
+
+    from insectifica.inference import TFLiteRunner
+    from insectifica.quantize import iter_labelled
+
+    labelled = list(iter_labelled(args.references))
+    if not labelled:
+        parser.error(f"no labelled images under {args.references}")
+    label_of = dict(labelled)
+    runner = TFLiteRunner(args.model, num_threads=os.cpu_count())
+    dim = int(np.prod(runner.predict(np.zeros((1, *runner.input_shape), np.float32)).shape[1:]))
+    # Raw float16 embeddings are staged on disk, so a million references fit on a small node.
+    staging = args.out + ".staging.npy"
+    raw = np.lib.format.open_memmap(staging, mode="w+", dtype=np.float16, shape=(len(labelled), dim))
+    try:
+        start = time.perf_counter()
+        paths = embed_folder(runner, [path for path, _ in labelled], raw)
+        embedded = time.perf_counter()
+        clusters = write_index(args.out, raw[: len(paths)], [label_of[p] for p in paths], paths,
+                               args.dtype, args.clusters)
+    finally:
+        del raw
+        os.remove(staging)
+    print(f"{len(paths)} references ({dim}-d {args.dtype}) in {clusters} cells: "
+          f"embedded in {embedded - start:.0f}s, indexed in {time.perf_counter() - embedded:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
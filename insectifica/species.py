@@ -0,0 +1,149 @@
+import functools
+import hashlib
+import json
+import re
+
+from insectifica import config, metrics
+
+# --------------------------------------------------
+# Model output labels, in the order of the classifier's output units
+# --------------------------------------------------
+class_names = [
+    'Acanthophilus helianthi rossi', 'Achaea janata', 'Acherontia styx', 'Adisura atkinsoni',
+    'Aedes aegypti', 'Aedes albopictus', 'Agrotis ipsilon', 'Alcidodes affaber',
+    'Aleurodicus dispersus', 'Amsacta albistriga', 'Anarsia ephippias', 'Anarsia epoitas',
+    'Anisolabis stallii', 'Antestia cruciata', 'Aphis craccivora', 'Apis mellifera',
+    'Apriona cinerea', 'Araecerus fasciculatus', 'Atractomorpha crenulata', 'Autographa nigrisigna',
+    'Bagrada hilaris', 'Basilepta fulvicorne', 'Batocera rufomaculata', 'Calathus erratus',
+    'Camponotus consobrinus', 'Chilasa clytia', 'Chilo sacchariphagus indicus',
+    'Conogethes punctiferalis', 'Danaus plexippus', 'Dendurus coarctatus',
+    'Deudorix (Virachola) isocrates', 'Elasmopalpus jasminophagus', 'Euwallacea fornicatus',
+    'Ferrisia virgata', 'Formosina flavipes', 'Gangara thyrsis', 'Holotrichia serrata',
+    'Hydrellia philippina', 'Hypolixus truncatulus', 'Leucopholis burmeisteri',
+    'Libellula depressa', 'Lucilia sericata', 'Melanagromyza obtusa', 'Mylabris phalerata',
+    'Oryctes rhinoceros', 'Paracoccus marginatus', 'Paradisynus rostratus', 'Parallelia algira',
+    'Parasa lepida', 'Pectinophora gossypiella', 'Pelopidas mathias', 'Pempherulus affinis',
+    'Pentalonia nigronervosa', 'peregrius maidis', 'Pericallia ricini', 'Perigea capensis',
+    'Petrobia latens', 'Phenacoccus solenopsis', 'Phoetaliotes nebrascensis',
+    'Phthorimaea operculella', 'Phyllocnistis citrella', 'Pieris brassicae', 'Pulchriphyllium',
+    'Rapala varuna', 'Rastrococcus iceryoides', 'Retithrips siriacus', 'Retithrips syriacus',
+    'Rhipiphorothrips cruentatus', 'Rhopalosiphum maidis', 'Rhopalosiphum padi',
+    'Rhynchophorus ferrugineus', 'Riptortus pedestris', 'Sahyadrassus malabaricus',
+    'Saissetia coffeae', 'Streptanus aemulans', 'sustama gremius', 'Sylepta derogata',
+    'Sympetrum signiferum', 'Sympetrum vulgatum', 'Tanymecus indicus Faust',
+    'Tetraneura nigriabdominalis', 'Tetrachynus cinnarinus', 'Tetranychus piercei',
+    'Thalassodes quadraria', 'Thosea andamanica', 'Thrips nigripilosus', 'Thrips orientalis',
+    'Thrips tabaci', 'Thysanoplusia orichalcea', 'Toxoptera odinae', 'Trialeurodes rara',
+    'Trialeurodes ricini', 'Trichoplusia ni', 'Tuta absoluta', 'Udaspes folus',
+    'Urentius hystricellus', 'uroleucon carthami', 'Vespula germanica', 'Xeroma mura',
+    'xylosadrus compactus', 'Xylotrchus quadripes', 'Zeuzera coffe', 'non insects',
+    'Papilio polytes', 'Periplaneta americana'
+]
+
+# Output class for photos without an insect in them.
+NON_INSECT = "non insects"
+
+
+# Fields with an inverted index; "Host Crops" holds a comma separated list.
+INDEXED_FIELDS = ("Order", "Family", "Host Crops")
+MISSING = {"", "na", "n/a", "not available"}
+
+
+def _norm(value):
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def split_values(field, value):
+    """Normalised index terms for one field of a record."""
+    parts = value.split(",") if field == "Host Crops" else [value]
+    return [t for t in (_norm(p) for p in parts) if t not in MISSING]
+
+
+# --------------------------------------------------
+# Knowledge base
+# --------------------------------------------------
+class KnowledgeBase:
+    """Species records aligned with the model's output units.
+
+    ``records[i]`` describes ``class_names[i]``; construction fails if any
+    class has no record, so a retrained model can't silently drift away
+    from the data shown to users.
+    """
+
+    def __init__(self, records, names=None, version=None):
+        names = list(class_names if names is None else names)
+        missing = [name for name in names if name not in records]
+        if missing:
+            raise ValueError(f"no species record for class(es): {', '.join(missing)}")
+        extra = sorted(set(records) - set(names))
+        if extra:
+            raise ValueError(f"species record(s) without a model class: {', '.join(extra)}")
+
+        self.class_names = names
+        self.records = [records[name] for name in names]
+        self.version = version or hashlib.sha256(
+            json.dumps([names, self.records], sort_keys=True).encode()
+        ).hexdigest()[:12]
+
+        self._by_scientific = {}
+        self._by_common = {}
+        self._index = {field: {} for field in INDEXED_FIELDS}
+        for idx, (name, record) in enumerate(zip(names, self.records)):
+            self._by_scientific[_norm(name)] = idx
+            self._by_scientific.setdefault(_norm(record.get("Scientific Name", name)), idx)
+            common = _norm(record.get("Common Name", ""))
+            if common not in MISSING:
+                self._by_common.setdefault(common, []).append(idx)
+            for field in INDEXED_FIELDS:
+                for term in split_values(field, record.get(field, "")):
+                    self._index[field].setdefault(term, []).append(idx)
+
+    @classmethod
+    def from_json(cls, path, names=None):
+        with open(path, "rb") as f:
+            raw = f.read()
+        return cls(json.loads(raw), names, version=hashlib.sha256(raw).hexdigest()[:12])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, idx):
+        return self.records[idx]
+
+    def __contains__(self, name):
+        return _norm(name) in self._by_scientific
+
+    def index_of(self, name):
+        """Class index for a scientific name (case-insensitive), or None."""
+        return self._by_scientific.get(_norm(name))
+
+    def get(self, name, default=None):
+        with metrics.stage("lookup"):
+            idx = self.index_of(name)
+            return default if idx is None else self.records[idx]
+
+    def by_common_name(self, name):
+        return [self.records[i] for i in self._by_common.get(_norm(name), ())]
+
+    def indices_by(self, field, value):
+        """Class indices whose ``field`` (Order, Family or Host Crops) contains ``value``."""
+        return list(self._index[field].get(_norm(value), ()))
+
+    def by_order(self, order):
+        return [self.records[i] for i in self.indices_by("Order", order)]
+
+    def by_family(self, family):
+        return [self.records[i] for i in self.indices_by("Family", family)]
+
+    def by_host_crop(self, crop):
+        return [self.records[i] for i in self.indices_by("Host Crops", crop)]
+
+    def values(self, field):
+        """Sorted distinct index terms for ``field``."""
+        return sorted(self._index[field])
+
+
+@functools.lru_cache(maxsize=None)
+def load_knowledge_base(path=None):
+    """Parse and validate the species file once per process."""
+    return KnowledgeBase.from_json(path or config.SPECIES_PATH)
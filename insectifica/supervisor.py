@@ -0,0 +1,160 @@
+"""Pre-forking supervisor for running the HTTP service on every core.
+
+    python -m insectifica.supervisor --workers 4 --port 8000
+
+The parent imports the interpreter backend, maps the model file read-only
+and faults its pages in, binds the listening socket, and only then forks.
+Workers inherit the imported code copy-on-write, and their interpreters map
+the same file, so the weights are held once in the page cache however many
+workers run (with INSECTIFICA_SHARED_WEIGHTS=1; XNNPACK otherwise packs its
+own copy per worker). Interpreters are created after the fork because their
+thread pools don't survive one.
+
+Each worker is pinned to its own slice of the CPUs the supervisor may use and
+gets one interpreter thread per CPU in it, so N workers never run more
+inference threads than there are cores. Dead workers are restarted; SIGTERM
+or Ctrl-C stops them all.
+"""
+import argparse
+import mmap
+import os
+import signal
+import socket
+import sys
+import time
+
+from insectifica import config
+
+# Workers that die sooner than this after starting are not restarted.
+MIN_UPTIME = 5.0
+
+
+def preload(model_path):
+    """Map the model read-only and touch every page, leaving it in the page cache.
+
+    The mapping is kept by the parent so the pages stay resident between
+    worker restarts.
+    """
+    with open(model_path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapped, "madvise"):
+        mapped.madvise(mmap.MADV_WILLNEED)
+    for offset in range(0, len(mapped), mmap.PAGESIZE):
+        mapped[offset]
+    return mapped
+
+
+def core_sets(workers, cpus=None):
+    """Split the available CPUs into ``workers`` contiguous, near-equal groups.
+
+    With more workers than CPUs the groups wrap around and share cores.
+    """
+    cpus = sorted(os.sched_getaffinity(0) if cpus is None else cpus)
+    if workers >= len(cpus):
+        return [{cpus[i % len(cpus)]} for i in range(workers)]
+    size, extra = divmod(len(cpus), workers)
+    groups, start = [], 0
+    for i in range(workers):
+        end = start + size + (i < extra)
+        groups.append(set(cpus[start:end]))
+        start = end
+    return groups
+
+
+def _serve(sock, cores, args):
+    # Runs in the forked child and never returns.
+    import uvicorn
+
+    from insectifica.server import create_app
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    os.sched_setaffinity(0, cores)
+    app = create_app(args.model, max_concurrency=args.max_concurrency,
+                     num_threads=len(cores), inline=True)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=args.log_level))
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, sock, args):
+        self.sock = sock
+        self.args = args
+        self.cores = core_sets(args.workers)
+        self.children = {}  # pid -> (slot, start time)
+        self.stopping = False
+
+    def spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _serve(self.sock, self.cores[slot], self.args)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = (slot, time.monotonic())
+        print(f"worker {slot} started (pid {pid}, cpus {sorted(self.cores[slot])})", flush=True)
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            slot, started = self.children.pop(pid)
+            if self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            print(f"worker {slot} (pid {pid}) exited with {code}", file=sys.stderr, flush=True)
+            if time.monotonic() - started < MIN_UPTIME:
+                print(f"worker {slot} is failing at startup; not restarting", file=sys.stderr)
+                continue
+            self.spawn(slot)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.supervisor",
+                                     description="Serve the classifier from pre-forked workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument("--max-concurrency", type=int, default=config.SERVER_MAX_CONCURRENCY)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args(argv)
+
+    # Everything imported or mapped here is shared with the workers.
+    from insectifica import inference, server  # noqa: F401
+    inference._interpreter_class()
+    mapped = preload(args.model)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    print(f"serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"({len(mapped) / 1e6:.1f} MB model mapped)", flush=True)
+    Supervisor(sock, args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Find, classify and count the insects on a sticky-trap photo.
+
+    python -m insectifica.traps trap.jpg --overlay trap.annotated.jpg
+
+A trap photo holds dozens of insects on a plain card, so instead of
+squashing it into one 190x190 input:
+
+1. propose   on a ~1536 px copy, pixels far from the local background colour
+             (the card, lighting gradient included) form a mask; an opening
+             removes specks and thin printed lines, and connected components
+             give one box per insect or per clump of touching insects
+2. classify  each box, padded to a square with some context, is cut from a
+             higher-resolution decode and resized straight to the model input;
+             the crops go through the model in large batches
+3. merge     class-aware non-maximum suppression folds fragments of one insect
+             together, and a clump counts as several insects by its area
+             against the median area of its (confidently identified) species
+
+``--tiles`` replaces step 1 with overlapping tiles, for traps whose
+background isn't plain enough for the mask; each tile then counts as one.
+"""
+import argparse
+import collections
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from insectifica import config, metrics
+from insectifica.postprocess import NON_INSECT_INDEX, calibrate, is_unknown, top_k
+from insectifica.preprocessing import open_image, preprocess_input
+from insectifica.species import class_names
+
+# Proposal stage, measured on the proposal copy.
+PROPOSAL_SIZE = 1536
+BACKGROUND_CELL = 32       # px averaged into one background sample
+FOREGROUND_DISTANCE = 48   # RGB distance from the background that counts as insect
+MIN_AREA = 8               # px; smaller blobs are dust
+MAX_EXTENT = 0.15          # share of the image side; longer blobs are frame or glare
+
+# Square crop around each blob: padding as a share of its longer side, and a
+# floor (in crop-image px) so the smallest insects keep some context.
+CONTEXT = 0.25
+MIN_CROP = 64
+
+NMS_IOU = 0.5
+UNIDENTIFIED = "Unidentified"
+
+
+def load_trap(source):
+    """Decode a trap photo at the resolution crops are cut from."""
+    return open_image(source, (config.TRAP_MAX_SIZE, config.TRAP_MAX_SIZE))
+
+
+# --------------------------------------------------
+# Proposals
+# --------------------------------------------------
+def label_components(mask):
+    """Bounding boxes ``(x0, y0, x1, y1)`` and pixel areas of the 8-connected regions of ``mask``.
+
+    Works on horizontal runs: runs on neighbouring rows that touch are
+    joined with a vectorised union-find, so the Python-level work doesn't
+    grow with the number of pixels.
+    """
+    height, width = mask.shape
+    edges = np.diff(np.pad(mask, ((0, 0), (1, 1))).astype(np.int8), axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    if not len(rows):
+        return np.empty((0, 4), dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    # Runs of row r-1 touching run (s, e) of row r end after s-1 and start
+    # before e+1; with rows folded into one key they form one sorted range.
+    stride = width + 2
+    start_keys, end_keys = rows * stride + starts, rows * stride + ends
+    lo = np.searchsorted(end_keys, (rows - 1) * stride + starts - 1, side="right")
+    hi = np.searchsorted(start_keys, (rows - 1) * stride + ends + 1, side="left")
+    links = np.maximum(hi - lo, 0)
+    a = np.repeat(np.arange(len(rows)), links)
+    b = np.arange(len(a)) - np.repeat(np.cumsum(links) - links - lo, links)
+
+    labels = np.arange(len(rows))
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        before = labels.copy()
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        labels = labels[labels]  # pointer jumping
+        if np.array_equal(labels, before):
+            break
+
+    _, component = np.unique(labels, return_inverse=True)
+    count = component.max() + 1
+    boxes = np.empty((count, 4), dtype=np.int64)
+    boxes[:, 0] = width
+    boxes[:, 1] = height
+    boxes[:, 2:] = 0
+    np.minimum.at(boxes[:, 0], component, starts)
+    np.minimum.at(boxes[:, 1], component, rows)
+    np.maximum.at(boxes[:, 2], component, ends)
+    np.maximum.at(boxes[:, 3], component, rows + 1)
+    areas = np.bincount(component, weights=ends - starts, minlength=count).astype(np.int64)
+    return boxes, areas
+
+
+def foreground_mask(image):
+    """Pixels of a trap image that differ clearly from the card behind them."""
+    width, height = image.size
+    # Median of coarse cells, so cells mostly covered by insects don't darken the card.
+    cells = image.resize((max(1, width // BACKGROUND_CELL), max(1, height // BACKGROUND_CELL)), Image.BOX)
+    background = cells.filter(ImageFilter.MedianFilter(5)).resize((width, height), Image.BILINEAR)
+    distance = np.linalg.norm(np.asarray(image, dtype=np.float32)
+                              - np.asarray(background, dtype=np.float32), axis=-1)
+    mask = Image.fromarray(((distance > FOREGROUND_DISTANCE) * 255).astype(np.uint8))
+    # Opening drops specks and hairline print, the extra dilation rejoins legs and wings.
+    mask = mask.filter(ImageFilter.MinFilter(3)).filter(ImageFilter.MaxFilter(3)).filter(ImageFilter.MaxFilter(3))
+    return np.asarray(mask) > 0
+
+
+def propose(image):
+    """Candidate boxes (and blob areas) in ``image`` coordinates, one per blob."""
+    with metrics.stage("trap_propose"):
+        small = image.copy()
+        small.thumbnail((PROPOSAL_SIZE, PROPOSAL_SIZE), reducing_gap=2.0)
+        boxes, areas = label_components(foreground_mask(small))
+        sizes = boxes[:, 2:] - boxes[:, :2]
+        keep = (areas >= MIN_AREA) & np.all(sizes <= MAX_EXTENT * np.array(small.size), axis=1)
+        scale = image.width / small.width
+    return boxes[keep] * scale, areas[keep] * scale ** 2
+
+
+def tile_boxes(width, height, tile=384, overlap=0.5):
+    """Overlapping square tiles covering a ``width`` x ``height`` image."""
+    step = max(1, int(tile * (1 - overlap)))
+    xs = np.unique(np.minimum(np.arange(0, max(width - tile, 0) + step, step), max(width - tile, 0)))
+    ys = np.unique(np.minimum(np.arange(0, max(height - tile, 0) + step, step), max(height - tile, 0)))
+    x0, y0 = np.meshgrid(xs, ys)
+    x0, y0 = x0.ravel(), y0.ravel()
+    return np.stack([x0, y0, np.minimum(x0 + tile, width), np.minimum(y0 + tile, height)], axis=1).astype(float)
+
+
+def crop_boxes(boxes, width, height):
+    """Square crops around ``boxes`` with context, shifted to stay inside the image."""
+    boxes = np.asarray(boxes, dtype=float)
+    centre = (boxes[:, :2] + boxes[:, 2:]) / 2
+    side = np.maximum((boxes[:, 2:] - boxes[:, :2]).max(axis=1) * (1 + 2 * CONTEXT), MIN_CROP)
+    side = np.minimum(side, min(width, height))
+    origin = np.clip(centre - side[:, None] / 2, 0, np.array([width, height]) - side[:, None])
+    return np.concatenate([origin, origin + side[:, None]], axis=1)
+
+
+# --------------------------------------------------
+# Classification and merging
+# --------------------------------------------------
+def classify_crops(image, boxes, predict, batch_size=None):
+    """Model probabilities for every box of ``image``, in batches of ``batch_size``."""
+    batch_size = batch_size or config.TRAP_BATCH_SIZE
+    width, height = config.IMAGE_SIZE
+    batch = np.empty((min(batch_size, len(boxes)), height, width, 3), dtype=np.float32)
+    outputs = []
+    for start in range(0, len(boxes), batch_size):
+        chunk = boxes[start:start + batch_size]
+        with metrics.stage("trap_crop"):
+            for row, box in enumerate(chunk):
+                # Crop and resize in one step; only the box's pixels are read.
+                crop = image.resize(config.IMAGE_SIZE, box=tuple(box), reducing_gap=2.0)
+                preprocess_input(np.asarray(crop), out=batch[row])
+        outputs.append(predict(batch[: len(chunk)]))
+    return np.concatenate(outputs) if outputs else np.empty((0, len(class_names)), dtype=np.float32)
+
+
+def nms(boxes, scores, labels, iou=NMS_IOU):
+    """Indices kept by greedy class-aware non-maximum suppression, best first."""
+    boxes = np.asarray(boxes, dtype=float)
+    if not len(boxes):
+        return np.empty(0, dtype=np.int64)
+    # Shifting every class into its own region of the plane makes a single pass class-aware.
+    boxes = boxes + (np.asarray(labels)[:, None] * (boxes.max() + 1))
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        overlap = (np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+                   * np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None))
+        order = rest[overlap / (areas[best] + areas[rest] - overlap) <= iou]
+    return np.array(keep, dtype=np.int64)
+
+
+def detect(image, predict, temperature=1.0, tiles=False, tile=384, batch_size=None):
+    """Insects on a decoded trap photo, as a list of detection dicts.
+
+    Each has the crop ``box`` in ``image`` pixels, ``species`` and its
+    ``class_index`` (both None when unsure), ``confidence``, ``unknown`` and
+    ``count``, the number of insects it stands for. ``predict`` takes a preprocessed float32 batch.
+    """
+    if tiles:
+        crops = tile_boxes(image.width, image.height, tile)
+        areas = None
+    else:
+        blobs, areas = propose(image)
+        crops = crop_boxes(blobs, image.width, image.height)
+    if not len(crops):
+        return []
+
+    probabilities = calibrate(classify_crops(image, crops, predict, batch_size), temperature)
+    idx, scores = top_k(probabilities, 1)
+    unknown = is_unknown(idx, scores)
+    insect = idx[:, 0] != NON_INSECT_INDEX
+    crops, idx, scores, unknown = crops[insect], idx[insect, 0], scores[insect, 0], unknown[insect]
+    areas = areas[insect] if areas is not None else None
+
+    # Unsure detections share one label, so they only suppress each other.
+    labels = np.where(unknown, len(class_names), idx)
+    keep = nms(crops, scores, labels)
+
+    counts = np.ones(len(crops), dtype=np.int64)
+    if areas is not None:
+        for label in np.unique(idx[keep][~unknown[keep]]):
+            members = keep[(labels[keep] == label)]
+            if len(members) >= 3:
+                # Blobs well above the typical size of their species are touching insects.
+                typical = np.median(areas[members])
+                counts[members] = np.maximum(1, np.floor(areas[members] / typical + 0.25))
+    return [
+        {
+            "box": [round(float(v), 1) for v in crops[i]],
+            "species": None if unknown[i] else class_names[idx[i]],
+            "class_index": None if unknown[i] else int(idx[i]),
+            "confidence": round(float(scores[i]), 4),
+            "unknown": bool(unknown[i]),
+            "count": int(counts[i]),
+        }
+        for i in keep
+    ]
+
+
+def species_counts(detections):
+    """Insects per species, most frequent first; unsure ones under ``UNIDENTIFIED``."""
+    counts = collections.Counter()
+    for detection in detections:
+        counts[detection["species"] or UNIDENTIFIED] += detection["count"]
+    return counts.most_common()
+
+
+# --------------------------------------------------
+# Overlay
+# --------------------------------------------------
+def _colour(class_index):
+    # Stable, saturated colour per species; grey for unsure detections.
+    if class_index is None:
+        return (128, 128, 128)
+    hue = (class_index * 0.618034) % 1.0
+    return tuple(int(255 * c) for c in _hsv(hue, 0.85, 0.9))
+
+
+def _hsv(h, s, v):
+    i = int(h * 6) % 6
+    f = h * 6 - int(h * 6)
+    p, q, t = v * (1 - s), v * (1 - s * f), v * (1 - s * (1 - f))
+    return [(v, t, p), (q, v, p), (p, v, t), (p, q, v), (t, p, v), (v, p, q)][i]
+
+
+def short_name(species):
+    """"Aphis craccivora" -> "A. craccivora"."""
+    if species is None:
+        return "?"
+    genus, _, rest = species.partition(" ")
+    return f"{genus[0]}. {rest}" if rest else species
+
+
+def annotate(image, detections, max_size=1600):
+    """Copy of ``image`` (at most ``max_size`` px) with a labelled box per detection."""
+    overlay = image.copy()
+    overlay.thumbnail((max_size, max_size), reducing_gap=2.0)
+    scale = overlay.width / image.width
+    draw = ImageDraw.Draw(overlay)
+    font = ImageFont.load_default(size=max(12, overlay.width // 90))
+    for detection in detections:
+        x0, y0, x1, y1 = (v * scale for v in detection["box"])
+        colour = _colour(detection["class_index"])
+        draw.rectangle((x0, y0, x1, y1), outline=colour, width=max(2, overlay.width // 500))
+        label = short_name(detection["species"])
+        if detection["count"] > 1:
+            label += f" x{detection['count']}"
+        draw.text((x0 + 2, y0 + 1), label, fill=colour, font=font, stroke_width=2, stroke_fill=(0, 0, 0))
+    return overlay
+
+
+def main(argv=None):
+    from insectifica.inference import TFLiteRunner, model_version
+    from insectifica.postprocess import load_temperature
+
+    parser = argparse.ArgumentParser(prog="python -m insectifica.traps",
+                                     description="Count the insects on sticky-trap photos.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--tiles", action="store_true", help="classify overlapping tiles instead of blobs")
+    parser.add_argument("--tile", type=int, default=384, help="tile side in px (with --tiles)")
+    parser.add_argument("--batch-size", type=int, default=config.TRAP_BATCH_SIZE)
+    parser.add_argument("--overlay", help="annotated JPEG to write (with one image); "
+                                          "'{stem}' is replaced by each image's name")
+    parser.add_argument("--calibration", default=config.CALIBRATION_PATH)
+    args = parser.parse_args(argv)
+
+    runner = TFLiteRunner(args.model, num_threads=os.cpu_count())
+    temperature = load_temperature(args.calibration, model_version(args.model))
+    for path in args.images:
+        start = time.perf_counter()
+        image = load_trap(path)
+        detections = detect(image, runner.predict, temperature, args.tiles, args.tile, args.batch_size)
+        seconds = time.perf_counter() - start
+        if args.overlay:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            annotate(image, detections).save(args.overlay.replace("{stem}", stem), quality=90)
+        print(json.dumps({
+            "file": path,
+            "seconds": round(seconds, 2),
+            "insects": sum(d["count"] for d in detections),
+            "counts": dict(species_counts(detections)),
+            "detections": detections,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import numpy as np
+
+from insectifica import config
+from insectifica.preprocessing import preprocess_input
+
+# (scale, anchor) of every crop, as a fraction of the square base image.
+# Scale 1.0 is the plain resize the model normally sees; 0.6 is a zoom-in.
+CROPS = (
+    (1.0, "center"),
+    (0.8, "center"),
+    (0.8, "top_left"),
+    (0.8, "top_right"),
+    (0.8, "bottom_left"),
+    (0.8, "bottom_right"),
+    (0.6, "center"),
+)
+# Every crop above plus a horizontal flip of the full view.
+NUM_VIEWS = len(CROPS) + 1
+
+
+def _box(size, scale, anchor):
+    side = round(size * scale)
+    far = size - side
+    x, y = {
+        "center": (far // 2, far // 2),
+        "top_left": (0, 0),
+        "top_right": (far, 0),
+        "bottom_left": (0, far),
+        "bottom_right": (far, far),
+    }[anchor]
+    return x, y, x + side, y + side
+
+
+def build_views(images):
+    """Stack ``NUM_VIEWS`` preprocessed views of every image into one float32 batch.
+
+    Each image is resized once to a square base large enough that the
+    smallest crop still has at least model-resolution pixels; crops then come
+    from that base rather than from the full upload.
+    """
+    width, height = config.IMAGE_SIZE
+    smallest = min(scale for scale, _ in CROPS)
+    base_size = round(max(width, height) / smallest)
+    batch = np.empty((len(images) * NUM_VIEWS, height, width, 3), dtype=np.float32)
+    row = 0
+    for image in images:
+        base = image.convert("RGB").resize((base_size, base_size), reducing_gap=3.0)
+        for scale, anchor in CROPS:
+            crop = base.resize((width, height), box=_box(base_size, scale, anchor))
+            preprocess_input(np.asarray(crop), out=batch[row])
+            row += 1
+        # Flip of the full view: reuse the already-normalised first row.
+        batch[row] = batch[row - len(CROPS)][:, ::-1]
+        row += 1
+    return batch
+
+
+def combine(probabilities, axis):
+    """Geometric mean of probability rows along ``axis`` (mean of log-probabilities), renormalised."""
+    log_p = np.log(np.clip(np.asarray(probabilities, dtype=np.float32), 1e-12, None))
+    mean = log_p.mean(axis=axis)
+    mean -= mean.max(axis=-1, keepdims=True)
+    np.exp(mean, out=mean)
+    mean /= mean.sum(axis=-1, keepdims=True)
+    return mean
+
+
+def aggregate_views(probabilities, num_views=NUM_VIEWS):
+    """Collapse ``(images * views, classes)`` model output to ``(images, classes)``."""
+    probabilities = np.asarray(probabilities)
+    return combine(probabilities.reshape(-1, num_views, probabilities.shape[-1]), axis=1)
+
+
+def fuse_specimen(probabilities):
+    """One ``(1, classes)`` prediction from several photos of the same specimen."""
+    return combine(probabilities, axis=0)[None]
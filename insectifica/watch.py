@@ -0,0 +1,323 @@
+"""Classify images as trap cameras drop them into a folder.
+
+    python -m insectifica.watch /srv/traps --out detections.jsonl
+
+The folder (and its sub-folders, e.g. one per camera) is polled for new
+files. Files are decoded on a thread pool, stacked into batches and run
+through the model on a single inference thread. Results are appended to a
+JSONL file in the same format as ``insectifica.batch``. Each stage talks to
+the next through a bounded queue, so a slow model stalls the decoders and
+then the scanner instead of piling up decoded images in memory.
+
+Every finished file is recorded in a SQLite checkpoint once its result has
+been flushed to the output, so a restart skips everything already written.
+A crash between those two steps can repeat a few lines, but no file is lost.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from insectifica import config
+from insectifica.batch import IMAGE_EXTENSIONS, JsonlSink, _decode
+from insectifica.inference import TFLiteRunner, model_version
+from insectifica.postprocess import load_temperature, postprocess
+from insectifica.preprocessing import preprocess_input
+from insectifica.species import class_names
+
+logger = logging.getLogger("insectifica.watch")
+
+# Directory mtimes this close to now may not reflect every file created in the
+# same tick (FAT stores 2 s steps), so such directories are listed again.
+MTIME_SLACK = 2.0
+
+
+# --------------------------------------------------
+# Checkpoint
+# --------------------------------------------------
+class Checkpoint:
+    """Paths that have already been classified, kept in SQLite."""
+
+    def __init__(self, path):
+        # Written from the inference thread once the watcher is running.
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed (path TEXT PRIMARY KEY, done REAL NOT NULL)"
+        )
+        self._done = {row[0] for row in self._conn.execute("SELECT path FROM processed")}
+
+    def __contains__(self, path):
+        return path in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def mark(self, paths):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO processed VALUES (?, ?)",
+                                   [(p, now) for p in paths])
+        self._done.update(paths)
+
+    def close(self):
+        self._conn.close()
+
+
+# --------------------------------------------------
+# Discovery
+# --------------------------------------------------
+class Scanner:
+    """Finds files that are new since the last scan.
+
+    Only directories whose mtime changed, or is still within
+    ``MTIME_SLACK`` of now, are listed again; the others are only stat()ed.
+    Every ``rescan_interval`` seconds all of them are listed, for network
+    and bind mounts whose directory mtimes can't be trusted. A file counts
+    as complete once it hasn't been modified for ``settle`` seconds; younger
+    files are re-checked on later scans.
+    """
+
+    def __init__(self, root, checkpoint, settle=1.0, rescan_interval=60.0):
+        self.root = root
+        self.checkpoint = checkpoint
+        self.settle = settle
+        self.rescan_interval = rescan_interval
+        self._next_rescan = 0.0
+        self._dir_mtimes = {}
+        self._subdirs = {}
+        self._unsettled = set()
+        self._queued = set()
+
+    def _walk(self, path, now, full=False):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._dir_mtimes.pop(path, None)
+            self._subdirs.pop(path, None)
+            return
+        if full or self._dir_mtimes.get(path) != mtime or now - mtime / 1e9 < MTIME_SLACK:
+            self._dir_mtimes[path] = mtime
+            subdirs = self._subdirs[path] = []
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        if entry.path not in self.checkpoint and entry.path not in self._queued:
+                            self._unsettled.add(entry.path)
+        for subdir in self._subdirs[path]:
+            self._walk(subdir, now, full)
+
+    def scan(self):
+        """Complete, unprocessed files found since the previous call, oldest first."""
+        full = time.monotonic() >= self._next_rescan
+        if full:
+            self._next_rescan = time.monotonic() + self.rescan_interval
+        now = time.time()
+        self._walk(self.root, now, full)
+        ready = []
+        for path in list(self._unsettled):
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                self._unsettled.discard(path)
+                continue
+            if now - mtime >= self.settle:
+                ready.append((mtime, path))
+                self._unsettled.discard(path)
+        ready.sort()
+        paths = [path for _, path in ready]
+        self._queued.update(paths)
+        return paths
+
+    def done(self, paths):
+        self._queued.difference_update(paths)
+
+
+# --------------------------------------------------
+# Pipeline
+# --------------------------------------------------
+class Watcher:
+    def __init__(self, root, runner, sink, checkpoint, batch_size=16, max_wait=0.5,
+                 decode_threads=None, poll_interval=1.0, settle=1.0, max_pending=256,
+                 k=3, temperature=1.0, threshold=None, rescan_interval=60.0):
+        self.runner = runner
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.scanner = Scanner(root, checkpoint, settle, rescan_interval)
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.k, self.temperature, self.threshold = k, temperature, threshold
+        self._decoders = ThreadPoolExecutor(max_workers=decode_threads or os.cpu_count(),
+                                            thread_name_prefix="insectifica-decode")
+        # TFLite interpreters aren't thread-safe: all inference on one thread.
+        self._inference = ThreadPoolExecutor(max_workers=1, thread_name_prefix="insectifica-infer")
+        self._paths = asyncio.Queue(maxsize=max_pending)
+        self._batches = asyncio.Queue(maxsize=2)
+        self._stopping = asyncio.Event()
+        self.processed = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _scan(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            for path in await loop.run_in_executor(None, self.scanner.scan):
+                await self._paths.put(path)  # blocks while the pipeline is saturated
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        await self._paths.put(None)
+
+    async def _next_chunk(self):
+        """Up to ``batch_size`` paths, waiting at most ``max_wait`` after the first."""
+        first = await self._paths.get()
+        if first is None:
+            return None
+        chunk = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(chunk) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                path = self._paths.get_nowait() if timeout <= 0 else \
+                    await asyncio.wait_for(self._paths.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if path is None:
+                self._paths.put_nowait(None)
+                break
+            chunk.append(path)
+        return chunk
+
+    async def _decode(self):
+        loop = asyncio.get_running_loop()
+        height, width = config.IMAGE_SIZE[1], config.IMAGE_SIZE[0]
+        while True:
+            chunk = await self._next_chunk()
+            if chunk is None:
+                break
+            decoded = await asyncio.gather(
+                *(loop.run_in_executor(self._decoders, _decode, path) for path in chunk))
+            batch = np.empty((len(chunk), height, width, 3), dtype=np.float32)
+            ok_paths, errors = [], []
+            for path, pixels, error in decoded:
+                if error is not None:
+                    errors.append((path, error))
+                    continue
+                preprocess_input(pixels, out=batch[len(ok_paths)])
+                ok_paths.append(path)
+            await self._batches.put((ok_paths, batch[: len(ok_paths)], errors))
+        await self._batches.put(None)
+
+    def _classify(self, ok_paths, batch, errors):
+        for path, error in errors:
+            self.sink.write(path, [], error)
+        if ok_paths:
+            probabilities = self.runner.predict(batch)
+            idx, scores, unknown = postprocess(probabilities, self.k, self.temperature, self.threshold)
+            for path, row_idx, row_scores, row_unknown in zip(ok_paths, idx, scores, unknown):
+                predictions = [(class_names[i], float(s)) for i, s in zip(row_idx, row_scores)]
+                self.sink.write(path, predictions, unknown=row_unknown)
+        self.sink.flush()
+        # Only after the results are flushed, so a crash never skips a file.
+        done = ok_paths + [path for path, _ in errors]
+        self.checkpoint.mark(done)
+        return done
+
+    async def _infer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._batches.get()
+            if item is None:
+                break
+            done = await loop.run_in_executor(self._inference, self._classify, *item)
+            self.scanner.done(done)
+            self.processed += len(done)
+
+    async def _report(self, every=60.0):
+        last, start = self.processed, time.monotonic()
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), every)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            logger.info("%d images in the last %.0fs (%.1f/s), %d waiting",
+                        self.processed - last, now - start,
+                        (self.processed - last) / (now - start), self._paths.qsize())
+            last, start = self.processed, now
+
+    async def run(self):
+        """Process files until ``stop()``; everything already queued is finished first."""
+        reporter = asyncio.create_task(self._report())
+        try:
+            await asyncio.gather(self._scan(), self._decode(), self._infer())
+        finally:
+            reporter.cancel()
+            self._decoders.shutdown()
+            self._inference.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m insectifica.watch",
+                                     description="Classify trap-camera images as they arrive.")
+    parser.add_argument("directory")
+    parser.add_argument("--out", default="detections.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", default=None,
+                        help="SQLite file of processed images (default: <out>.checkpoint)")
+    parser.add_argument("--model", default=config.MODEL_PATH)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-wait", type=float, default=0.5,
+                        help="seconds a partial batch waits for more images")
+    parser.add_argument("--decode-threads", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=os.cpu_count(),
+                        help="interpreter threads per forward pass")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="seconds a file must be unmodified before it is read")
+    parser.add_argument("--rescan-interval", type=float, default=60.0,
+                        help="seconds between listings of every sub-folder, changed or not")
+    parser.add_argument("--calibration", default=config.CALIBRATION_PATH)
+    parser.add_argument("--unknown-threshold", type=float, default=config.UNKNOWN_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    checkpoint = Checkpoint(args.checkpoint or args.out + ".checkpoint")
+    runner = TFLiteRunner(args.model, num_threads=args.threads)
+    stream = open(args.out, "a", newline="")
+    watcher = Watcher(
+        os.path.abspath(args.directory), runner, JsonlSink(stream, args.top_k), checkpoint,
+        batch_size=args.batch_size, max_wait=args.max_wait, decode_threads=args.decode_threads,
+        poll_interval=args.poll_interval, settle=args.settle, k=args.top_k,
+        temperature=load_temperature(args.calibration, model_version(args.model)),
+        threshold=args.unknown_threshold, rescan_interval=args.rescan_interval,
+    )
+    logger.info("watching %s (%d images already processed)", args.directory, len(checkpoint))
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, watcher.stop)
+        await watcher.run()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stream.close()
+        checkpoint.close()
+    logger.info("stopped after %d images", watcher.processed)
+
+
+if __name__ == "__main__":
+    main()
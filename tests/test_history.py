@@ -0,0 +1,43 @@
+import threading
+
+from insectifica.history import HistoryStore
+
+
+def flush_within(store, seconds=10):
+    done = threading.Thread(target=store.flush, daemon=True)
+    done.start()
+    done.join(seconds)
+    return not done.is_alive()
+
+
+def test_writer_survives_failed_batch(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    # model_version is NOT NULL, so this batch fails to insert.
+    store.record("bad", [("Aphis craccivora", 0.9)], None)
+    assert flush_within(store)
+
+    store.record("good", [("Aphis craccivora", 0.9)], "v1")
+    assert flush_within(store)
+    assert [row["image_hash"] for row in store.page()] == ["good"]
+    store.close()
+
+
+def test_failing_listener_does_not_block_commits(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.db"), flush_interval=0.01)
+    seen = []
+
+    def broken(conn, rows):
+        conn.execute("CREATE TABLE IF NOT EXISTS partial (x)")
+        conn.execute("INSERT INTO partial VALUES (1)")
+        raise RuntimeError("listener failed")
+
+    store.add_listener(broken)
+    store.add_listener(lambda conn, rows: seen.extend(rows))
+    store.record("a", [("Aphis craccivora", 0.9)], "v1")
+    assert flush_within(store)
+    assert store.count() == 1
+    assert len(seen) == 1
+    # The broken listener's own writes were rolled back.
+    assert store.connection().execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'partial'").fetchone()[0] == 0
+    store.close()